@@ -4,14 +4,138 @@ Intel AIPC OpenVINO GenAI API 客户端示例
 演示如何调用本地部署的 OpenAI 兼容 API 服务
 """
 
+import asyncio
+import hashlib
 import json
+import re
 import requests
+import sys
 import time
-from typing import List, Dict
+import urllib3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+try:
+    import httpx  # 可选依赖：用于并发异步调用
+except ImportError:
+    httpx = None
+
+# JSON 编解码：优先使用 orjson (C 实现)，未安装时回退到标准库
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
 
 # API 服务器配置
 API_BASE_URL = "http://localhost:8000"
 API_KEY = "dummy"  # 本地服务暂不需要真实 API Key
+STREAM_FLUSH_EVERY = 16  # 流式输出时每累计多少个 token 刷新一次终端
+SSE_CHUNK_SIZE = 65536   # 流式响应每次读取的字节数
+SSE_DATA_PREFIX = b"data: "
+SSE_DONE = b"[DONE]"
+
+# 确定性请求 (低温度、非流式) 的客户端响应缓存
+CACHE_MAX_TEMPERATURE = 0.05  # 温度不高于该值的请求才会被缓存
+CACHE_MAX_ENTRIES = 1024
+CACHE_TTL = 3600              # 缓存有效期（秒）
+_RESPONSE_CACHE: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+# 全局复用的 HTTP 会话：keep-alive 连接池，避免每次请求重新握手
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=5, backoff_factor=0.2, status_forcelist=(429, 502, 503, 504))
+)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.headers.update({
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {API_KEY}"
+})
+
+# 流式热路径直接使用 urllib3 连接池，跳过 requests 的钩子/适配器/Cookie 处理
+_POOL = urllib3.PoolManager(
+    num_pools=1,
+    maxsize=32,
+    block=False,
+    retries=False,
+    headers={
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {API_KEY}"
+    }
+)
+
+# SSE 增量解析：直接从字节中提取 delta 的 "content" 字段，避免每个 token 一次完整 json.loads
+_CONTENT_RE = re.compile(rb'"content"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def extract_delta_content(data: bytes) -> Optional[str]:
+    """从一个 SSE data 负载中提取增量内容，没有内容时返回 None"""
+    match = _CONTENT_RE.search(data)
+    if match:
+        raw = match.group(1)
+        if b'\\' not in raw:
+            return raw.decode('utf-8')
+        # 含转义字符时交给 json 解码这一小段字符串
+        return json_loads(b'"' + raw + b'"')
+    
+    if b'"content"' not in data:
+        return None  # 例如结束块 (delta 为空，只带 finish_reason)
+    
+    # 快速路径未命中（如 content 为 null），回退到完整解析
+    try:
+        chunk_data = json_loads(data)
+        return chunk_data['choices'][0]['delta'].get('content')
+    except (ValueError, KeyError, IndexError):
+        return None
+
+
+def iter_sse_data(response: urllib3.HTTPResponse):
+    """按行切分 SSE 响应流，依次产出每个 data 负载 (bytes)
+    
+    在缓冲区内按偏移量扫描，只为 data 负载复制一次字节，每个读取块结束后才整体压缩缓冲区
+    """
+    buf = bytearray()
+    find = buf.find  # bytearray 原地扩展，绑定方法在循环中保持有效
+    startswith = buf.startswith
+    prefix = SSE_DATA_PREFIX
+    skip = len(prefix)
+    for chunk in response.stream(SSE_CHUNK_SIZE):
+        buf += chunk
+        start = 0
+        while True:
+            end = find(b"\n", start)
+            if end == -1:
+                break
+            if startswith(prefix, start, end):
+                stop = end - 1 if buf[end - 1] == 0x0D else end  # 兼容 \r\n 行尾
+                yield bytes(buf[start + skip:stop])
+            start = end + 1
+        del buf[:start]
+
+
+def post_stream(url: str, data: Dict, timeout: Optional[float] = None) -> urllib3.HTTPResponse:
+    """发起流式 POST 请求，返回未预读响应体的 urllib3 响应"""
+    response = _POOL.request(
+        "POST", url,
+        body=json_dumps(data),
+        preload_content=False,
+        timeout=urllib3.Timeout(connect=5.0, read=timeout)
+    )
+    if response.status >= 400:
+        response.drain_conn()
+        response.release_conn()
+        raise requests.HTTPError(f"{response.status} Error for url: {url}")
+    return response
 
 
 def call_chat_completion(
@@ -24,10 +148,6 @@ def call_chat_completion(
     """调用聊天完成 API"""
     
     url = f"{API_BASE_URL}/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
     
     data = {
         "model": model,
@@ -39,56 +159,181 @@ def call_chat_completion(
     
     if stream:
         # 流式调用
-        response = requests.post(url, headers=headers, json=data, stream=True)
-        response.raise_for_status()
+        response = post_stream(url, data)
         
         print("🔵 助手：", end='', flush=True)
-        collected_content = ""
+        parts: List[str] = []
+        # 热循环内用到的函数和常量预先绑定为局部变量
+        write = sys.stdout.write
+        flush = sys.stdout.flush
+        extract = extract_delta_content
+        done = SSE_DONE
+        flush_every = STREAM_FLUSH_EVERY
+        pending = 0  # 尚未刷新到终端的 token 数
         
-        for line in response.iter_lines():
-            if line:
-                line_str = line.decode('utf-8')
-                if line_str.startswith('data: '):
-                    data_str = line_str[6:]  # 去除 'data: ' 前缀
-                    
-                    if data_str == '[DONE]':
-                        break
-                    
-                    try:
-                        chunk_data = json.loads(data_str)
-                        if chunk_data['choices'][0]['delta'].get('content'):
-                            content = chunk_data['choices'][0]['delta']['content']
-                            print(content, end='', flush=True)
-                            collected_content += content
-                    except json.JSONDecodeError:
-                        continue
-        print()  # 换行
-        return collected_content
+        try:
+            for payload in iter_sse_data(response):
+                if payload == done:
+                    break
+                
+                content = extract(payload)
+                if content:
+                    write(content)
+                    parts.append(content)
+                    pending += 1
+                    if pending >= flush_every or '\n' in content:
+                        flush()
+                        pending = 0
+        finally:
+            response.drain_conn()
+            response.release_conn()
+        print(flush=True)  # 换行
+        return "".join(parts)
     else:
-        # 非流式调用
-        response = requests.post(url, headers=headers, json=data)
+        # 非流式调用：确定性请求先查缓存
+        cache_key = None
+        if temperature <= CACHE_MAX_TEMPERATURE:
+            cache_key = hashlib.sha256(json_dumps([model, messages, temperature, max_tokens])).hexdigest()
+            cached = _cache_get(cache_key)
+            if cached is not None:
+                return cached
+        
+        response = _SESSION.post(url, data=json_dumps(data))
         response.raise_for_status()
         
-        result = response.json()
-        return result['choices'][0]['message']['content']
+        result = json_loads(response.content)
+        content = result['choices'][0]['message']['content']
+        if cache_key is not None:
+            _cache_put(cache_key, content)
+        return content
+
+
+def _cache_get(key: str) -> Optional[str]:
+    """读取未过期的缓存回复（LRU：命中后移到末尾）"""
+    entry = _RESPONSE_CACHE.get(key)
+    if entry is None:
+        return None
+    stored_at, content = entry
+    if time.monotonic() - stored_at > CACHE_TTL:
+        del _RESPONSE_CACHE[key]
+        return None
+    _RESPONSE_CACHE.move_to_end(key)
+    return content
+
+
+def _cache_put(key: str, content: str):
+    """写入缓存，超出容量时淘汰最久未使用的条目"""
+    _RESPONSE_CACHE[key] = (time.monotonic(), content)
+    _RESPONSE_CACHE.move_to_end(key)
+    while len(_RESPONSE_CACHE) > CACHE_MAX_ENTRIES:
+        _RESPONSE_CACHE.popitem(last=False)
 
 
 def list_models() -> List[str]:
     """获取可用模型列表"""
     url = f"{API_BASE_URL}/v1/models"
-    response = requests.get(url)
+    response = _SESSION.get(url)
     response.raise_for_status()
     
-    result = response.json()
+    result = json_loads(response.content)
     return [model['id'] for model in result['data']]
 
 
 def check_health() -> Dict:
     """检查服务健康状态"""
     url = f"{API_BASE_URL}/health"
-    response = requests.get(url)
+    response = _SESSION.get(url)
+    response.raise_for_status()
+    return json_loads(response.content)
+
+
+# ==== 异步并发调用 (需要 httpx) ====
+_ASYNC_CLIENT: Optional["httpx.AsyncClient"] = None
+
+
+def _get_async_client() -> "httpx.AsyncClient":
+    """获取全局共享的 httpx.AsyncClient（所有协程复用同一连接池）"""
+    global _ASYNC_CLIENT
+    if httpx is None:
+        raise RuntimeError("异步调用需要安装 httpx: pip install httpx[http2]")
+    if _ASYNC_CLIENT is None or _ASYNC_CLIENT.is_closed:
+        try:
+            import h2  # noqa: F401  HTTP/2 支持是可选的
+            http2 = True
+        except ImportError:
+            http2 = False
+        _ASYNC_CLIENT = httpx.AsyncClient(
+            base_url=API_BASE_URL,
+            http2=http2,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {API_KEY}"
+            },
+            limits=httpx.Limits(max_connections=64),
+            timeout=httpx.Timeout(None, connect=5.0)
+        )
+    return _ASYNC_CLIENT
+
+
+async def acall_chat_completion(
+    messages: List[Dict[str, str]],
+    model: str = "qwen2.5-7b-int4",
+    temperature: float = 0.2,
+    max_tokens: int = 640,
+    stream: bool = False
+) -> str:
+    """异步调用聊天完成 API（流式时收集完整回复，不逐字打印）"""
+    client = _get_async_client()
+    data = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": stream
+    }
+    
+    if stream:
+        parts: List[str] = []
+        async with client.stream("POST", "/v1/chat/completions", content=json_dumps(data)) as response:
+            response.raise_for_status()
+            prefix = SSE_DATA_PREFIX
+            skip = len(prefix)
+            done = SSE_DONE
+            extract = extract_delta_content
+            async for line_str in response.aiter_lines():
+                line = line_str.encode('utf-8')
+                if not line.startswith(prefix):
+                    continue
+                payload = line[skip:]
+                if payload == done:
+                    break
+                content = extract(payload)
+                if content:
+                    parts.append(content)
+        return "".join(parts)
+    
+    response = await client.post("/v1/chat/completions", content=json_dumps(data))
     response.raise_for_status()
-    return response.json()
+    return json_loads(response.content)['choices'][0]['message']['content']
+
+
+async def acall_chat_completions(
+    conversations: List[List[Dict[str, str]]],
+    max_workers: int = 4,
+    **kwargs
+) -> List[str]:
+    """并发执行多组对话，用信号量限制同时在途的请求数"""
+    semaphore = asyncio.Semaphore(max_workers)
+    
+    async def _one(messages):
+        async with semaphore:
+            return await acall_chat_completion(messages, **kwargs)
+    
+    try:
+        return await asyncio.gather(*(_one(messages) for messages in conversations))
+    finally:
+        if _ASYNC_CLIENT is not None:
+            await _ASYNC_CLIENT.aclose()
 
 
 def main():
@@ -96,9 +341,14 @@ def main():
     print("🚀 Intel AIPC OpenVINO GenAI API 客户端示例")
     print("=" * 50)
     
+    # 健康检查与模型列表互不依赖，两个预检请求同时发出
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        health_future = executor.submit(check_health)
+        models_future = executor.submit(list_models)
+    
     # 1. 检查服务状态
     try:
-        health = check_health()
+        health = health_future.result()
         print(f"🏥 服务状态: {health['status']}")
         print(f"📱 设备: {health['device']}")
         print(f"📂 模型目录: {health['model_dir']}")
@@ -110,7 +360,7 @@ def main():
     
     # 2. 获取模型列表
     try:
-        models = list_models()
+        models = models_future.result()
         print(f"📋 可用模型: {models}")
         print()
     except Exception as e:
@@ -126,13 +376,13 @@ def main():
     ]
     
     try:
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         response = call_chat_completion(messages, stream=False)
-        end_time = time.time()
+        end_ns = time.perf_counter_ns()
         
         print(f"🟢 用户：{messages[0]['content']}")
         print(f"🔵 助手：{response}")
-        print(f"⏱️  耗时：{end_time - start_time:.2f}秒")
+        print(f"⏱️  耗时：{(end_ns - start_ns) * 1e-9:.2f}秒")
         print()
     except Exception as e:
         print(f"❌ 请求失败: {e}")
@@ -154,7 +404,30 @@ def main():
     except Exception as e:
         print(f"❌ 流式请求失败: {e}")
     
-    # 5. 交互式对话
+    # 5. 并发请求示例 (需要 httpx)
+    if httpx is not None:
+        print("🔄 并发请求示例 (异步)")
+        print("-" * 30)
+        
+        questions = ["什么是机器学习？", "什么是深度学习？", "什么是强化学习？"]
+        try:
+            start_ns = time.perf_counter_ns()
+            answers = asyncio.run(acall_chat_completions(
+                [[{"role": "user", "content": q}] for q in questions],
+                max_workers=len(questions),
+                max_tokens=100
+            ))
+            end_ns = time.perf_counter_ns()
+            
+            for question, answer in zip(questions, answers):
+                print(f"🟢 用户：{question}")
+                print(f"🔵 助手：{answer}")
+            print(f"⏱️  并发耗时：{(end_ns - start_ns) * 1e-9:.2f}秒")
+            print()
+        except Exception as e:
+            print(f"❌ 并发请求失败: {e}")
+    
+    # 6. 交互式对话
     print("💬 交互式对话 (输入 'quit' 退出)")
     print("-" * 30)
     
@@ -3,13 +3,20 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import openvino_genai as ov_genai
+import numpy as np
 import time
-import statistics
 import json
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import argparse
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # ==== 配置参数 ====
 MODEL_DIR = r".\qwen2.5-ov-int4"
@@ -31,18 +38,35 @@ DEVICES = ["CPU", "GPU", "NPU"]
 MAX_NEW_TOKENS = 512
 WARMUP_ROUNDS = 2
 TEST_ROUNDS = 5
+PREFIX_CACHE = False  # 是否启用跨轮次的前缀KV缓存 (仅CPU/GPU支持)
 
-class TokenCounter:
-    """Token计数器，用于统计生成的token数量"""
-    def __init__(self):
-        self.count = 0
-    
-    def __call__(self, subword: str) -> ov_genai.StreamingStatus:
-        self.count += 1
-        return ov_genai.StreamingStatus.RUNNING
+# 计算资源互不重叠、可以同时测试的设备 (GPU与CPU共享LLC，单独测试)
+CONCURRENT_DEVICES = {"CPU", "NPU"}
+
+_PRINT_LOCK = threading.Lock()
+
+def log(*args, **kwargs):
+    """线程安全的打印，并行测试多个设备时避免输出行交错"""
+    with _PRINT_LOCK:
+        print(*args, **kwargs)
+
+def summarize(values: np.ndarray) -> Dict:
+    """计算一组样本的均值/中位数/样本标准差/最小值/最大值，空数组全部返回0"""
+    if not values.size:
+        return {"mean": 0, "median": 0, "std": 0, "min": 0, "max": 0}
+    return {
+        "mean": float(values.mean()),
+        "median": float(np.median(values)),
+        "std": float(values.std(ddof=1)) if values.size > 1 else 0,
+        "min": float(values.min()),
+        "max": float(values.max())
+    }
 
 class BenchmarkResult:
     """测试结果数据类"""
+    __slots__ = ("device", "prompt_index", "prompt", "tokens_generated",
+                 "time_taken", "tokens_per_second", "first_token_latency")
+    
     def __init__(self):
         self.device = ""
         self.prompt_index = 0
@@ -57,12 +81,27 @@ class DeviceBenchmark:
     
     def __init__(self, device: str):
         self.device = device
-        self.results: List[BenchmarkResult] = []
+        self.results: List[BenchmarkResult] = []  # 完整结果，用于报告
+        # 统计用的列式存储 (SoA)，避免汇总时逐个访问对象属性
+        capacity = TEST_ROUNDS * len(TEST_PROMPTS)
+        self._throughputs = np.zeros(capacity, dtype=np.float64)
+        self._latencies = np.zeros(capacity, dtype=np.float64)
+        self._count = 0
+    
+    def record(self, result: BenchmarkResult):
+        """保存一次正式测试的结果"""
+        if self._count == self._throughputs.size:
+            self._throughputs = np.resize(self._throughputs, self._count * 2 or 1)
+            self._latencies = np.resize(self._latencies, self._count * 2 or 1)
+        self._throughputs[self._count] = result.tokens_per_second
+        self._latencies[self._count] = result.first_token_latency
+        self._count += 1
+        self.results.append(result)
         
     def setup_pipeline(self) -> ov_genai.LLMPipeline:
         """初始化推理管线"""
         try:
-            print(f"🔧 正在初始化 {self.device} 设备...")
+            log(f"🔧 正在初始化 {self.device} 设备...")
             
             # 根据设备选择不同的配置
             if self.device == "CPU":
@@ -77,30 +116,62 @@ class DeviceBenchmark:
             else:
                 raise ValueError(f"不支持的设备: {self.device}")
             
+            pipe_kwargs = {"PERFORMANCE_HINT": hint, "CACHE_DIR": CACHE_DIR}
+            if PREFIX_CACHE:
+                if self.device in ("CPU", "GPU"):
+                    # 同一prompt的后续轮次直接复用已缓存的前缀KV，跳过prefill
+                    scheduler_config = ov_genai.SchedulerConfig()
+                    scheduler_config.enable_prefix_caching = True
+                    pipe_kwargs["scheduler_config"] = scheduler_config
+                else:
+                    log(f"⚠️  {self.device} 不支持前缀缓存，按普通模式运行")
+            
             pipe = ov_genai.LLMPipeline(
                 MODEL_DIR,
                 device_str,
-                PERFORMANCE_HINT=hint,
-                CACHE_DIR=CACHE_DIR
+                **pipe_kwargs
             )
             
-            print(f"✅ {self.device} 设备初始化成功")
+            log(f"✅ {self.device} 设备初始化成功")
             return pipe
             
         except Exception as e:
-            print(f"❌ {self.device} 设备初始化失败: {e}")
+            log(f"❌ {self.device} 设备初始化失败: {e}")
             return None
     
-    def run_single_test(self, pipe: ov_genai.LLMPipeline, prompt: str, prompt_index: int) -> BenchmarkResult:
-        """运行单次测试"""
+    def tokenize_prompts(self, pipe: ov_genai.LLMPipeline) -> List:
+        """对全部测试prompt预先分词一次，各轮次复用，首token延迟只反映prefill"""
+        tokenizer = pipe.get_tokenizer()
+        prompt_inputs = []
+        use_chat_template = True
+        for prompt in TEST_PROMPTS:
+            text = None
+            if use_chat_template:
+                try:
+                    # 与直接传入字符串时一致：先套用聊天模板再编码
+                    text = tokenizer.apply_chat_template(
+                        [{"role": "user", "content": prompt}], add_generation_prompt=True
+                    )
+                except RuntimeError as e:
+                    # openvino_genai 在模型未提供聊天模板时抛出 RuntimeError，其他错误照常上抛
+                    if "chat template" not in str(e).lower():
+                        raise
+                    use_chat_template = False
+                    log(f"⚠️  {self.device} 模型未提供聊天模板，改为直接编码原始prompt")
+            if text is None:
+                prompt_inputs.append(tokenizer.encode(prompt))
+            else:
+                prompt_inputs.append(tokenizer.encode(text, add_special_tokens=False))
+        return prompt_inputs
+    
+    def run_single_test(self, pipe: ov_genai.LLMPipeline, prompt: str, prompt_index: int,
+                        prompt_inputs=None) -> BenchmarkResult:
+        """运行单次测试 (prompt_inputs为预分词结果，为空时由管线自行分词)"""
         result = BenchmarkResult()
         result.device = self.device
         result.prompt_index = prompt_index
         result.prompt = prompt
         
-        # 创建token计数器
-        token_counter = TokenCounter()
-        
         # 生成配置
         gen_cfg = ov_genai.GenerationConfig(
             max_new_tokens=MAX_NEW_TOKENS,
@@ -108,46 +179,53 @@ class DeviceBenchmark:
             do_sample=False   # 确定性生成
         )
         
-        # 记录开始时间
-        start_time = time.perf_counter()
-        first_token_time = None
+        # token计数与首token时间(整数纳秒，0表示尚未收到)放在可变单元中，回调里只做一次下标自增
+        token_count = [0]
+        first_token = [0]
         
-        def streaming_callback(subword: str) -> ov_genai.StreamingStatus:
-            nonlocal first_token_time
-            if first_token_time is None:
-                first_token_time = time.perf_counter()
-            return token_counter(subword)
+        def streaming_callback(subword: str,
+                               _count=token_count,
+                               _first=first_token,
+                               _now=time.perf_counter_ns,
+                               _running=ov_genai.StreamingStatus.RUNNING) -> ov_genai.StreamingStatus:
+            _count[0] += 1
+            if not _first[0]:
+                _first[0] = _now()
+            return _running
+        
+        # 记录开始时间
+        start_ns = time.perf_counter_ns()
         
         # 执行推理
         try:
-            pipe.generate(prompt, gen_cfg, streaming_callback)
-            end_time = time.perf_counter()
+            pipe.generate(prompt if prompt_inputs is None else prompt_inputs, gen_cfg, streaming_callback)
+            end_ns = time.perf_counter_ns()
             
-            # 计算结果
-            result.tokens_generated = token_counter.count
-            result.time_taken = end_time - start_time
-            result.first_token_latency = (first_token_time - start_time) if first_token_time else 0
+            # 计算结果 (整数纳秒相减，最后才换算为秒)
+            result.tokens_generated = token_count[0]
+            result.time_taken = (end_ns - start_ns) * 1e-9
+            result.first_token_latency = (first_token[0] - start_ns) * 1e-9 if first_token[0] else 0.0
             result.tokens_per_second = result.tokens_generated / result.time_taken if result.time_taken > 0 else 0
             
         except Exception as e:
-            print(f"❌ 测试失败: {e}")
+            log(f"❌ 测试失败: {e}")
             result.tokens_per_second = 0
             
         return result
     
-    def run_warmup(self, pipe: ov_genai.LLMPipeline):
+    def run_warmup(self, pipe: ov_genai.LLMPipeline, prompt_inputs: List):
         """运行预热测试"""
-        print(f"🔥 {self.device} 预热中...")
+        log(f"🔥 {self.device} 预热中...")
         for i in range(WARMUP_ROUNDS):
-            prompt = TEST_PROMPTS[i % len(TEST_PROMPTS)]
-            self.run_single_test(pipe, prompt, -1)  # 预热不记录结果
-        print(f"✅ {self.device} 预热完成")
+            idx = i % len(TEST_PROMPTS)
+            self.run_single_test(pipe, TEST_PROMPTS[idx], -1, prompt_inputs[idx])  # 预热不记录结果
+        log(f"✅ {self.device} 预热完成")
     
     def run_benchmark(self) -> bool:
         """运行完整的基准测试"""
-        print(f"\n{'='*60}")
-        print(f"🚀 开始测试 {self.device} 设备性能")
-        print(f"{'='*60}")
+        log(f"\n{'='*60}")
+        log(f"🚀 开始测试 {self.device} 设备性能")
+        log(f"{'='*60}")
         
         # 初始化管线
         pipe = self.setup_pipeline()
@@ -155,29 +233,30 @@ class DeviceBenchmark:
             return False
         
         try:
+            prompt_inputs = self.tokenize_prompts(pipe)
+            
             # 预热
-            self.run_warmup(pipe)
+            self.run_warmup(pipe, prompt_inputs)
             
-            # 正式测试
-            print(f"📊 开始正式测试...")
-            for round_num in range(TEST_ROUNDS):
-                print(f"  轮次 {round_num + 1}/{TEST_ROUNDS}")
+            # 正式测试：同一prompt的各轮次连续执行，便于前缀KV缓存命中
+            log(f"📊 开始正式测试...")
+            for prompt_idx, prompt in enumerate(TEST_PROMPTS):
+                log(f"  [{self.device}] 测试用例 {prompt_idx + 1}/{len(TEST_PROMPTS)}: {prompt[:30]}...")
                 
-                for prompt_idx, prompt in enumerate(TEST_PROMPTS):
-                    print(f"    测试用例 {prompt_idx + 1}/{len(TEST_PROMPTS)}: {prompt[:30]}...")
+                for round_num in range(TEST_ROUNDS):
+                    result = self.run_single_test(pipe, prompt, prompt_idx, prompt_inputs[prompt_idx])
+                    self.record(result)
                     
-                    result = self.run_single_test(pipe, prompt, prompt_idx)
-                    self.results.append(result)
-                    
-                    print(f"      生成 {result.tokens_generated} tokens, "
+                    log(f"    [{self.device}] 轮次 {round_num + 1}/{TEST_ROUNDS}: "
+                          f"生成 {result.tokens_generated} tokens, "
                           f"用时 {result.time_taken:.2f}s, "
                           f"速度 {result.tokens_per_second:.2f} tokens/s")
             
-            print(f"✅ {self.device} 测试完成")
+            log(f"✅ {self.device} 测试完成")
             return True
             
         except Exception as e:
-            print(f"❌ {self.device} 测试过程中发生错误: {e}")
+            log(f"❌ {self.device} 测试过程中发生错误: {e}")
             return False
         finally:
             # 清理资源
@@ -185,40 +264,31 @@ class DeviceBenchmark:
     
     def get_statistics(self) -> Dict:
         """计算统计数据"""
-        if not self.results:
+        if not self._count:
             return {}
         
-        throughputs = [r.tokens_per_second for r in self.results if r.tokens_per_second > 0]
-        latencies = [r.first_token_latency for r in self.results if r.first_token_latency > 0]
+        throughputs = self._throughputs[:self._count]
+        latencies = self._latencies[:self._count]
+        throughputs = throughputs[throughputs > 0]
+        latencies = latencies[latencies > 0]
         
-        if not throughputs:
+        if not throughputs.size:
             return {}
         
         return {
             "device": self.device,
-            "total_tests": len(self.results),
-            "successful_tests": len(throughputs),
-            "throughput": {
-                "mean": statistics.mean(throughputs),
-                "median": statistics.median(throughputs),
-                "std": statistics.stdev(throughputs) if len(throughputs) > 1 else 0,
-                "min": min(throughputs),
-                "max": max(throughputs)
-            },
-            "first_token_latency": {
-                "mean": statistics.mean(latencies) if latencies else 0,
-                "median": statistics.median(latencies) if latencies else 0,
-                "std": statistics.stdev(latencies) if len(latencies) > 1 else 0,
-                "min": min(latencies) if latencies else 0,
-                "max": max(latencies) if latencies else 0
-            }
+            "total_tests": self._count,
+            "successful_tests": int(throughputs.size),
+            "throughput": summarize(throughputs),
+            "first_token_latency": summarize(latencies)
         }
 
 class BenchmarkRunner:
     """基准测试运行器"""
     
-    def __init__(self, devices: List[str] = None):
+    def __init__(self, devices: List[str] = None, parallel: bool = False):
         self.devices = devices or DEVICES
+        self.parallel = parallel
         self.device_benchmarks: Dict[str, DeviceBenchmark] = {}
         self.start_time = None
         self.end_time = None
@@ -231,23 +301,42 @@ class BenchmarkRunner:
         print(f"🎛️  最大token数: {MAX_NEW_TOKENS}")
         print(f"🔄 预热轮次: {WARMUP_ROUNDS}")
         print(f"📊 测试轮次: {TEST_ROUNDS}")
+        print(f"🗂️  前缀缓存: {'开启' if PREFIX_CACHE else '关闭'}")
         print(f"📝 测试用例数: {len(TEST_PROMPTS)}")
         
+        print(f"⚡ 并行测试: {'开启' if self.parallel else '关闭'}")
+        
         self.start_time = time.time()
         
+        benchmarks = {device: DeviceBenchmark(device) for device in self.devices}
+        outcomes: Dict[str, bool] = {}
+        
+        serial_devices = list(self.devices)
+        if self.parallel:
+            # CPU与NPU同时测试：推理在OpenVINO原生代码中执行并释放GIL
+            concurrent_devices = [d for d in self.devices if d in CONCURRENT_DEVICES]
+            if len(concurrent_devices) > 1:
+                serial_devices = [d for d in self.devices if d not in CONCURRENT_DEVICES]
+                with ThreadPoolExecutor(max_workers=len(concurrent_devices)) as executor:
+                    futures = {d: executor.submit(benchmarks[d].run_benchmark) for d in concurrent_devices}
+                    outcomes.update({d: f.result() for d, f in futures.items()})
+        
+        for device in serial_devices:
+            outcomes[device] = benchmarks[device].run_benchmark()
+        
         for device in self.devices:
-            benchmark = DeviceBenchmark(device)
-            success = benchmark.run_benchmark()
-            
-            if success:
-                self.device_benchmarks[device] = benchmark
+            if outcomes[device]:
+                self.device_benchmarks[device] = benchmarks[device]
             else:
                 print(f"⚠️  {device} 设备测试跳过")
         
         self.end_time = time.time()
     
-    def generate_report(self) -> Dict:
-        """生成测试报告"""
+    def generate_report(self, device_stats: Optional[Dict[str, Dict]] = None) -> Dict:
+        """生成测试报告 (可传入已计算好的各设备统计，避免重复计算)"""
+        if device_stats is None:
+            device_stats = self.collect_statistics()
+        
         report = {
             "test_info": {
                 "timestamp": datetime.now().isoformat(),
@@ -255,66 +344,74 @@ class BenchmarkRunner:
                 "max_new_tokens": MAX_NEW_TOKENS,
                 "warmup_rounds": WARMUP_ROUNDS,
                 "test_rounds": TEST_ROUNDS,
+                "prefix_cache": PREFIX_CACHE,
+                "parallel": self.parallel,
                 "test_prompts_count": len(TEST_PROMPTS),
                 "total_duration": self.end_time - self.start_time if self.end_time and self.start_time else 0
             },
-            "device_results": {}
+            "device_results": device_stats
         }
         
+        return report
+    
+    def collect_statistics(self) -> Dict[str, Dict]:
+        """每个设备只计算一次统计数据，跳过没有有效结果的设备"""
+        device_stats = {}
         for device, benchmark in self.device_benchmarks.items():
             stats = benchmark.get_statistics()
             if stats:
-                report["device_results"][device] = stats
-        
-        return report
+                device_stats[device] = stats
+        return device_stats
     
     def print_summary(self):
-        """打印测试总结"""
-        print(f"\n{'='*80}")
-        print("📊 测试结果总结")
-        print(f"{'='*80}")
+        """打印测试总结 (所有行拼接后一次写出)"""
+        lines = [f"\n{'='*80}", "📊 测试结果总结", f"{'='*80}"]
         
         if not self.device_benchmarks:
-            print("❌ 没有成功完成的测试")
+            lines.append("❌ 没有成功完成的测试")
+            sys.stdout.write("\n".join(lines) + "\n")
             return
         
-        # 设备性能排序
-        device_performance = []
-        for device, benchmark in self.device_benchmarks.items():
-            stats = benchmark.get_statistics()
-            if stats and stats.get("throughput"):
-                device_performance.append((device, stats["throughput"]["mean"]))
+        device_stats = self.collect_statistics()
         
-        device_performance.sort(key=lambda x: x[1], reverse=True)
+        # 设备性能排序
+        device_performance = sorted(
+            ((device, stats["throughput"]["mean"]) for device, stats in device_stats.items()),
+            key=lambda x: x[1], reverse=True
+        )
         
-        # 打印详细结果
-        print(f"{'设备':<8} {'平均吞吐率':<15} {'中位数吞吐率':<15} {'首token延迟':<15} {'标准差':<10}")
-        print("-" * 80)
+        # 详细结果
+        lines.append(f"{'设备':<8} {'平均吞吐率':<15} {'中位数吞吐率':<15} {'首token延迟':<15} {'标准差':<10}")
+        lines.append("-" * 80)
         
-        for device, benchmark in self.device_benchmarks.items():
-            stats = benchmark.get_statistics()
-            if stats and stats.get("throughput"):
-                tp = stats["throughput"]
-                lat = stats["first_token_latency"]
-                print(f"{device:<8} {tp['mean']:<15.2f} {tp['median']:<15.2f} "
-                      f"{lat['mean']*1000:<15.1f} {tp['std']:<10.2f}")
+        for device, stats in device_stats.items():
+            tp = stats["throughput"]
+            lat = stats["first_token_latency"]
+            lines.append(f"{device:<8} {tp['mean']:<15.2f} {tp['median']:<15.2f} "
+                         f"{lat['mean']*1000:<15.1f} {tp['std']:<10.2f}")
         
         # 推荐方案
-        print(f"\n🏆 性能排行榜:")
-        for i, (device, throughput) in enumerate(device_performance, 1):
-            print(f"  {i}. {device}: {throughput:.2f} tokens/s")
+        lines.append(f"\n🏆 性能排行榜:")
+        lines.extend(f"  {i}. {device}: {throughput:.2f} tokens/s"
+                     for i, (device, throughput) in enumerate(device_performance, 1))
         
         if device_performance:
             best_device = device_performance[0][0]
-            print(f"\n💡 推荐方案: {best_device} (最高吞吐率: {device_performance[0][1]:.2f} tokens/s)")
+            lines.append(f"\n💡 推荐方案: {best_device} (最高吞吐率: {device_performance[0][1]:.2f} tokens/s)")
+        
+        sys.stdout.write("\n".join(lines) + "\n")
         
         # 保存详细报告
-        report = self.generate_report()
+        report = self.generate_report(device_stats)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         report_file = f"benchmark_report_{timestamp}.json"
         
-        with open(report_file, 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+            with open(report_file, 'wb') as f:
+                f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(report_file, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(report, ensure_ascii=False, indent=2))
         
         print(f"\n📄 详细报告已保存到: {report_file}")
 
@@ -324,15 +421,20 @@ def main():
                        default=['CPU', 'GPU', 'NPU'], help='要测试的设备列表')
     parser.add_argument('--tokens', type=int, default=512, help='最大生成token数')
     parser.add_argument('--rounds', type=int, default=5, help='测试轮次')
+    parser.add_argument('--prefix-cache', action='store_true',
+                       help='启用前缀KV缓存，同一prompt的后续轮次跳过prefill (仅CPU/GPU)')
+    parser.add_argument('--parallel', action='store_true',
+                       help='同时测试CPU与NPU (GPU仍单独测试)')
     
     args = parser.parse_args()
     
-    global MAX_NEW_TOKENS, TEST_ROUNDS
+    global MAX_NEW_TOKENS, TEST_ROUNDS, PREFIX_CACHE
     MAX_NEW_TOKENS = args.tokens
     TEST_ROUNDS = args.rounds
+    PREFIX_CACHE = args.prefix_cache
     
     try:
-        runner = BenchmarkRunner(args.devices)
+        runner = BenchmarkRunner(args.devices, parallel=args.parallel)
         runner.run_all_tests()
         runner.print_summary()
         
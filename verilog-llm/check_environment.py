@@ -6,7 +6,7 @@
 
 import sys
 import os
-import importlib
+import importlib.util
 from pathlib import Path
 
 def check_python_version():
@@ -21,15 +21,14 @@ def check_python_version():
         return False
 
 def check_module(module_name, display_name=None):
-    """检查模块是否可用"""
+    """检查模块是否可用（只定位模块，不执行其初始化代码）"""
     if display_name is None:
         display_name = module_name
     
-    try:
-        importlib.import_module(module_name)
+    if importlib.util.find_spec(module_name) is not None:
         print(f"  ✅ {display_name}")
         return True
-    except ImportError:
+    else:
         print(f"  ❌ {display_name} (未安装)")
         return False
 
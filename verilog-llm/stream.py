@@ -2,6 +2,8 @@
 # Copyright (C) 2024-2025 Intel
 # SPDX-License-Identifier: Apache-2.0
 
+import sys
+
 import openvino_genai as ov_genai
 
 # ==== 请根据需要修改这 3 行 ====
@@ -10,9 +12,17 @@ DEVICE         = "AUTO:NPU,GPU"            # 先 NPU，不行就 GPU
 MAX_NEW_TOKENS = 640                       # 每轮最多生成 token 数
 # =================================
 
+FLUSH_EVERY = 16                           # 每累计多少个 sub-word 刷新一次终端
+_pending = 0
+
 def streamer(subword: str) -> ov_genai.StreamingStatus:
-    """每收到一个 sub-word 就立即打印。"""
-    print(subword, end='', flush=True)
+    """收到 sub-word 后写入缓冲，遇到换行或每 FLUSH_EVERY 个才刷新终端。"""
+    global _pending
+    sys.stdout.write(subword)
+    _pending += 1
+    if _pending >= FLUSH_EVERY or '\n' in subword:
+        sys.stdout.flush()
+        _pending = 0
     return ov_genai.StreamingStatus.RUNNING   # 不打断生成
 
 def main():
@@ -41,7 +51,7 @@ def main():
 
             print("🔵 助手：", end='', flush=True)
             pipe.generate(prompt, gen_cfg, streamer)   # ← 流式回调
-            print("\n────────────")
+            print("\n────────────", flush=True)
     finally:
         pipe.finish_chat()                  # 清理资源
 
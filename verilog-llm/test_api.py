@@ -3,20 +3,24 @@
 快速测试 Intel AIPC OpenVINO GenAI API 服务
 """
 
-import requests
-import json
 import sys
 import time
 
+# 所有测试共用客户端模块的 keep-alive 会话（连接池与重试配置只在一处维护）
+from api_client_example import (
+    SSE_DONE, STREAM_FLUSH_EVERY, _SESSION, extract_delta_content, iter_sse_data, json_dumps, json_loads,
+    post_stream
+)
+
 API_BASE_URL = "http://localhost:8000"
 
 def test_health():
     """测试健康检查"""
     print("🔍 测试健康检查...")
     try:
-        response = requests.get(f"{API_BASE_URL}/health", timeout=5)
+        response = _SESSION.get(f"{API_BASE_URL}/health", timeout=5)
         if response.status_code == 200:
-            data = response.json()
+            data = json_loads(response.content)
             print(f"✅ 健康检查通过")
             print(f"   状态: {data['status']}")
             print(f"   模型已加载: {data['model_loaded']}")
@@ -33,9 +37,9 @@ def test_models():
     """测试模型列表"""
     print("\n📋 测试模型列表...")
     try:
-        response = requests.get(f"{API_BASE_URL}/v1/models", timeout=5)
+        response = _SESSION.get(f"{API_BASE_URL}/v1/models", timeout=5)
         if response.status_code == 200:
-            data = response.json()
+            data = json_loads(response.content)
             models = [model['id'] for model in data['data']]
             print(f"✅ 模型列表获取成功: {models}")
             return True
@@ -61,22 +65,21 @@ def test_chat_completion():
     }
     
     try:
-        start_time = time.time()
-        response = requests.post(
+        start_ns = time.perf_counter_ns()
+        response = _SESSION.post(
             f"{API_BASE_URL}/v1/chat/completions",
-            headers={"Content-Type": "application/json"},
-            json=data,
+            data=json_dumps(data),
             timeout=30
         )
-        end_time = time.time()
+        end_ns = time.perf_counter_ns()
         
         if response.status_code == 200:
-            result = response.json()
+            result = json_loads(response.content)
             content = result['choices'][0]['message']['content']
             print(f"✅ 聊天完成测试成功")
             print(f"   请求: {data['messages'][0]['content']}")
             print(f"   回复: {content}")
-            print(f"   耗时: {end_time - start_time:.2f}秒")
+            print(f"   耗时: {(end_ns - start_ns) * 1e-9:.2f}秒")
             return True
         else:
             print(f"❌ 聊天完成测试失败: HTTP {response.status_code}")
@@ -101,40 +104,31 @@ def test_stream():
     }
     
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/v1/chat/completions",
-            headers={"Content-Type": "application/json"},
-            json=data,
-            stream=True,
-            timeout=30
-        )
+        response = post_stream(f"{API_BASE_URL}/v1/chat/completions", data, timeout=30)
         
-        if response.status_code == 200:
-            print("✅ 流式响应测试开始")
-            print("   响应内容: ", end='', flush=True)
-            
-            for line in response.iter_lines():
-                if line:
-                    line_str = line.decode('utf-8')
-                    if line_str.startswith('data: '):
-                        data_str = line_str[6:]
-                        
-                        if data_str == '[DONE]':
-                            break
-                        
-                        try:
-                            chunk_data = json.loads(data_str)
-                            if chunk_data['choices'][0]['delta'].get('content'):
-                                content = chunk_data['choices'][0]['delta']['content']
-                                print(content, end='', flush=True)
-                        except json.JSONDecodeError:
-                            continue
-            
-            print("\n✅ 流式响应测试完成")
-            return True
-        else:
-            print(f"❌ 流式响应测试失败: HTTP {response.status_code}")
-            return False
+        print("✅ 流式响应测试开始")
+        print("   响应内容: ", end='', flush=True)
+        write = sys.stdout.write
+        pending = 0
+        
+        try:
+            for payload in iter_sse_data(response):
+                if payload == SSE_DONE:
+                    break
+                
+                content = extract_delta_content(payload)
+                if content:
+                    write(content)
+                    pending += 1
+                    if pending >= STREAM_FLUSH_EVERY or '\n' in content:
+                        sys.stdout.flush()
+                        pending = 0
+        finally:
+            response.drain_conn()
+            response.release_conn()
+        
+        print("\n✅ 流式响应测试完成")
+        return True
     except Exception as e:
         print(f"❌ 流式响应测试失败: {e}")
         return False
@@ -158,7 +152,6 @@ def main():
     for test_name, test_func in tests:
         if test_func():
             passed += 1
-        time.sleep(1)  # 测试间隔
     
     print("\n" + "=" * 50)
     print(f"📊 测试结果: {passed}/{total} 通过")
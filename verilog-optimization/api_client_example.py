@@ -4,25 +4,97 @@ Verilog优化API客户端示例
 演示如何使用API服务优化Verilog代码
 """
 
+import random
 import requests
 import json
 import time
-from typing import Optional, Dict, Any
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Iterator, Tuple
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx  # 可选依赖：HTTP/2 多路复用传输
+except ImportError:
+    httpx = None
+
+# JSON解码：优先使用 orjson (C 实现)，未安装时回退到标准库
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# 两种传输的请求异常类型
+REQUEST_ERRORS = (requests.RequestException,) if httpx is None else (requests.RequestException, httpx.HTTPError)
+
+# 长轮询：服务端挂起 /status 请求直到状态变化，最长等待时间（秒）
+# 每次在上限以下 [STATUS_WAIT * (1 - STATUS_WAIT_JITTER), STATUS_WAIT] 内随机取值，避免大量客户端同时超时重连
+# （抖动取在服务端上限30秒以内，不会被服务端截断成同一个值）
+STATUS_WAIT = 30
+STATUS_WAIT_JITTER = 0.1
+
+# 查询失败时的指数退避参数
+POLL_BACKOFF_BASE = 0.5   # 首次重试基准延迟（秒）
+POLL_BACKOFF_MAX = 30     # 最大重试延迟（秒）
+MAX_POLL_FAILURES = 5     # 连续失败多少次后放弃
+
+# SSE 连接读超时（秒），需大于服务端心跳间隔
+EVENTS_READ_TIMEOUT = 35
+
+DOWNLOAD_CHUNK_SIZE = 8192  # 流式下载代码时每次读取的字节数
+
+# SSE 推送不压缩：gzip 会缓冲小事件，导致状态推送延迟
+EVENTS_HEADERS = {"Accept-Encoding": "identity"}
+
+def report_status(status: Dict[str, Any], last_state: Optional[Tuple]) -> Tuple:
+    """打印任务状态，与上次相同时跳过；返回本次的 (status, message)"""
+    current = (status.get('status'), status.get('message'))
+    if current != last_state:
+        print(f"📊 状态: {current[0]} - {current[1]}")
+    return current
 
 class VerilogOptimizerClient:
     """Verilog优化API客户端"""
     
-    def __init__(self, base_url: str = "http://localhost:8000"):
-        """初始化客户端"""
+    def __init__(self, base_url: str = "http://localhost:8000", http2: bool = False):
+        """初始化客户端
+        
+        Args:
+            base_url: API服务地址
+            http2: 使用httpx的HTTP/2传输，并发请求复用同一连接（需安装httpx[http2]，
+                   服务端需经TLS提供HTTP/2；不可用时回退到requests）
+        """
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
+        self.session = self._create_http2_session() if http2 else None
+        if self.session is None:
+            self.session = requests.Session()
+            # 连接池：轮询与并发任务复用已建立的keep-alive连接，不重复握手
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, pool_block=False, max_retries=0)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+            self.session.headers.update({"Connection": "keep-alive"})
+    
+    @staticmethod
+    def _create_http2_session():
+        """创建HTTP/2会话，httpx或h2未安装时返回None"""
+        if httpx is None:
+            return None
+        try:
+            return httpx.Client(
+                http2=True,
+                timeout=httpx.Timeout(STATUS_WAIT + 5, connect=5.0),
+                limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=60)
+            )
+        except ImportError:  # 未安装h2
+            return None
     
     def health_check(self) -> bool:
         """检查API服务健康状态"""
         try:
             response = self.session.get(f"{self.base_url}/health")
             return response.status_code == 200
-        except requests.RequestException:
+        except REQUEST_ERRORS:
             return False
     
     def optimize_code(
@@ -31,7 +103,8 @@ class VerilogOptimizerClient:
         optimization_level: str = "readable",
         n_trials: int = 30,
         top_module: Optional[str] = None,
-        timeout: int = 300
+        timeout: int = 300,
+        preview_lines: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         优化Verilog代码
@@ -42,6 +115,7 @@ class VerilogOptimizerClient:
             n_trials: 优化试验次数
             top_module: 顶层模块名
             timeout: 超时时间
+            preview_lines: 只取回优化代码的前N行（完整代码可用download_code下载）
         
         Returns:
             优化结果字典
@@ -69,15 +143,15 @@ class VerilogOptimizerClient:
             )
             response.raise_for_status()
             
-            job_info = response.json()
+            job_info = json_loads(response.content)
             job_id = job_info["job_id"]
             
             print(f"✅ 任务已提交，ID: {job_id}")
             
             # 轮询任务状态
-            return self._wait_for_completion(job_id, timeout)
+            return self._wait_for_completion(job_id, timeout, preview_lines)
             
-        except requests.RequestException as e:
+        except REQUEST_ERRORS as e:
             return {"error": f"请求失败: {str(e)}"}
     
     def optimize_file(
@@ -113,48 +187,142 @@ class VerilogOptimizerClient:
         except UnicodeDecodeError:
             return {"error": f"文件编码错误: {file_path}"}
     
-    def _wait_for_completion(self, job_id: str, timeout: int) -> Dict[str, Any]:
-        """等待任务完成"""
+    @contextmanager
+    def _stream_lines(self, url: str) -> Iterator[Iterator[str]]:
+        """以流式GET打开URL，产出逐行读取的文本迭代器"""
+        if httpx is not None and isinstance(self.session, httpx.Client):
+            with self.session.stream("GET", url, headers=EVENTS_HEADERS,
+                                     timeout=httpx.Timeout(EVENTS_READ_TIMEOUT, connect=5.0)) as response:
+                response.raise_for_status()
+                yield response.iter_lines()
+        else:
+            with self.session.get(url, stream=True, headers=EVENTS_HEADERS,
+                                  timeout=(5, EVENTS_READ_TIMEOUT)) as response:
+                response.raise_for_status()
+                yield response.iter_lines(decode_unicode=True)
+    
+    @contextmanager
+    def _stream_chunks(self, url: str) -> Iterator[Iterator[bytes]]:
+        """以流式GET打开URL，产出按块读取的字节迭代器"""
+        if httpx is not None and isinstance(self.session, httpx.Client):
+            with self.session.stream("GET", url) as response:
+                response.raise_for_status()
+                yield response.iter_bytes(DOWNLOAD_CHUNK_SIZE)
+        else:
+            with self.session.get(url, stream=True) as response:
+                response.raise_for_status()
+                yield response.iter_content(DOWNLOAD_CHUNK_SIZE)
+    
+    def _wait_for_events(self, job_id: str, deadline: float) -> Optional[Dict[str, Any]]:
+        """订阅 /events/{job_id} 的SSE推送，返回任务的最终状态
+        
+        服务端不支持SSE、连接中断或超过截止时间时返回None，由调用方回退到轮询
+        """
+        last_state = None
+        try:
+            with self._stream_lines(f"{self.base_url}/events/{job_id}") as lines:
+                for line in lines:
+                    if time.time() >= deadline:
+                        return None
+                    if not line.startswith("data: "):
+                        continue  # 事件名、心跳注释与空行
+                    
+                    status = json_loads(line[6:])
+                    state = status['status']
+                    last_state = report_status(status, last_state)
+                    if state in ('completed', 'failed'):
+                        return status
+        except REQUEST_ERRORS + (ValueError,):  # 含推送数据无法解析
+            pass
+        return None
+    
+    def _fetch_result(self, job_id: str, status: Dict[str, Any],
+                      preview_lines: Optional[int] = None) -> Dict[str, Any]:
+        """获取已结束任务的结果"""
+        params = {"preview": preview_lines} if preview_lines else None
+        if status['status'] == 'completed':
+            result_response = self.session.get(f"{self.base_url}/result/{job_id}", params=params)
+            result_response.raise_for_status()
+            return json_loads(result_response.content)
+        
+        result_response = self.session.get(f"{self.base_url}/result/{job_id}", params=params)
+        if result_response.status_code == 200:
+            return json_loads(result_response.content)
+        return {"error": f"任务失败: {status.get('message')}"}
+    
+    def _wait_for_completion(self, job_id: str, timeout: int,
+                             preview_lines: Optional[int] = None) -> Dict[str, Any]:
+        """等待任务完成：优先使用SSE推送，不可用时回退到长轮询"""
         
         start_time = time.time()
         
+        status = self._wait_for_events(job_id, start_time + timeout)
+        if status is not None:
+            try:
+                return self._fetch_result(job_id, status, preview_lines)
+            except REQUEST_ERRORS as e:
+                return {"error": f"获取结果失败: {str(e)}"}
+        
+        failures = 0  # 连续失败次数，成功后清零
+        last_state = None  # 状态未变化时不重复打印
+        
         while time.time() - start_time < timeout:
             try:
-                # 查询任务状态
-                status_response = self.session.get(f"{self.base_url}/status/{job_id}")
+                # 查询任务状态（长轮询，状态变化或超时后返回）
+                wait = round(STATUS_WAIT * random.uniform(1 - STATUS_WAIT_JITTER, 1.0), 1)
+                status_response = self.session.get(
+                    f"{self.base_url}/status/{job_id}",
+                    params={"wait": wait},
+                    timeout=wait + 5
+                )
                 status_response.raise_for_status()
+                failures = 0
                 
-                status = status_response.json()
-                print(f"📊 状态: {status['status']} - {status['message']}")
+                status = json_loads(status_response.content)  # 每个响应体只解析一次
+                state = status['status']
+                last_state = report_status(status, last_state)
                 
-                if status['status'] == 'completed':
-                    # 获取结果
-                    result_response = self.session.get(f"{self.base_url}/result/{job_id}")
-                    result_response.raise_for_status()
-                    return result_response.json()
+                if state in ('completed', 'failed'):
+                    return self._fetch_result(job_id, status, preview_lines)
                 
-                elif status['status'] == 'failed':
-                    result_response = self.session.get(f"{self.base_url}/result/{job_id}")
-                    if result_response.status_code == 200:
-                        return result_response.json()
-                    else:
-                        return {"error": f"任务失败: {status['message']}"}
+            except REQUEST_ERRORS as e:
+                # 4xx（如任务不存在）重试无意义，直接返回
+                response = getattr(e, 'response', None)
+                if response is not None and 400 <= response.status_code < 500:
+                    return {"error": f"查询状态失败: {str(e)}"}
                 
-                # 等待一段时间再查询
-                time.sleep(2)
+                failures += 1
+                if failures >= MAX_POLL_FAILURES:
+                    return {"error": f"查询状态失败: {str(e)}"}
                 
-            except requests.RequestException as e:
-                return {"error": f"查询状态失败: {str(e)}"}
+                # 指数退避加随机抖动，避免服务重启期间多个客户端同步重试
+                delay = min(POLL_BACKOFF_MAX, POLL_BACKOFF_BASE * 2 ** failures) * random.uniform(0.5, 1.5)
+                print(f"⚠️  查询状态失败（{failures}/{MAX_POLL_FAILURES}），{delay:.1f}秒后重试: {e}")
+                time.sleep(delay)
         
         return {"error": "任务超时"}
     
+    def download_code(self, job_id: str, file_path: str) -> Dict[str, Any]:
+        """将任务的完整优化代码流式写入文件，不在内存中保留整份代码"""
+        written = 0
+        try:
+            with self._stream_chunks(f"{self.base_url}/result/{job_id}/code") as chunks, \
+                    open(file_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+        except REQUEST_ERRORS as e:
+            return {"error": f"下载代码失败: {str(e)}"}
+        
+        return {"file_path": file_path, "bytes": written}
+    
     def get_job_status(self, job_id: str) -> Dict[str, Any]:
         """获取任务状态"""
         try:
             response = self.session.get(f"{self.base_url}/status/{job_id}")
             response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            return json_loads(response.content)
+        except REQUEST_ERRORS as e:
             return {"error": f"获取状态失败: {str(e)}"}
     
     def list_jobs(self) -> Dict[str, Any]:
@@ -162,8 +330,8 @@ class VerilogOptimizerClient:
         try:
             response = self.session.get(f"{self.base_url}/jobs")
             response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            return json_loads(response.content)
+        except REQUEST_ERRORS as e:
             return {"error": f"获取任务列表失败: {str(e)}"}
 
 def print_optimization_result(result: Dict[str, Any]):
@@ -197,7 +365,8 @@ def print_optimization_result(result: Dict[str, Any]):
         if result.get('optimized_code'):
             print(f"\n📄 优化后代码:")
             print("-" * 40)
-            print(result['optimized_code'][:500] + "..." if len(result['optimized_code']) > 500 else result['optimized_code'])
+            code = result['optimized_code']
+            print(code[:500] + "..." if len(code) > 500 or result.get('code_truncated') else code)
     
     elif result['status'] == 'failed':
         print("❌ 优化失败!")
@@ -245,7 +414,7 @@ endmodule
     print("📝 示例1: 默认优化（readable策略）")
     print(f"{'='*60}")
     
-    result1 = client.optimize_code(sample_verilog)
+    result1 = client.optimize_code(sample_verilog, preview_lines=20)  # 只打印预览，不取回完整代码
     print_optimization_result(result1)
     
     # 示例2: 使用minimal策略
@@ -256,10 +425,19 @@ endmodule
     result2 = client.optimize_code(
         sample_verilog,
         optimization_level="minimal",
-        n_trials=20
+        n_trials=20,
+        preview_lines=20
     )
     print_optimization_result(result2)
     
+    # 完整代码流式保存到文件
+    if result2.get('status') == 'completed':
+        download = client.download_code(result2['job_id'], f"{result2['job_id']}_opt.v")
+        if "error" in download:
+            print(f"❌ {download['error']}")
+        else:
+            print(f"💾 完整代码已保存到: {download['file_path']} ({download['bytes']} 字节)")
+    
     # 示例3: 对比不同策略
     print(f"\n{'='*60}")
     print("📝 示例3: 策略对比")
@@ -267,14 +445,22 @@ endmodule
     
     strategies = ["minimal", "readable", "balanced"]
     
-    for strategy in strategies:
+    # 各策略的任务互相独立，并发提交与等待，总耗时约为最慢的一个
+    with ThreadPoolExecutor(max_workers=len(strategies)) as executor:
+        futures = {
+            strategy: executor.submit(
+                client.optimize_code,
+                sample_verilog,
+                optimization_level=strategy,
+                n_trials=15,  # 快速测试
+                preview_lines=1  # 只比较统计信息，不需要代码
+            )
+            for strategy in strategies
+        }
+        results = {strategy: future.result() for strategy, future in futures.items()}
+    
+    for strategy, result in results.items():
         print(f"\n🔧 测试策略: {strategy}")
-        result = client.optimize_code(
-            sample_verilog,
-            optimization_level=strategy,
-            n_trials=15  # 快速测试
-        )
-        
         if result.get('optimization_stats'):
             stats = result['optimization_stats']
             print(f"   行数: {stats.get('original_lines')} → {stats.get('optimized_lines')}")
@@ -4,9 +4,21 @@
 演示如何生成可读的优化Verilog代码
 """
 
+import hashlib
+import os
+import re
 import tempfile
+import time
 from pathlib import Path
 import subprocess
+from collections import Counter
+from itertools import islice
+
+CACHE_DIR = Path(tempfile.gettempdir()) / "vop_cache"
+OPTIMIZATION_TIMEOUT = 120
+
+# analyze_result 一次扫描收集的所有特征（wire/assign 后的空格不消耗，仍计入空格数）
+FEATURE_PATTERN = re.compile(r"(?:wire|assign)(?= )|sum|product|mux|_| ")
 
 # 测试设计 - 包含常见的数字逻辑结构
 DEMO_DESIGN = """
@@ -40,8 +52,12 @@ def create_test_file():
     test_file.write_text(DEMO_DESIGN)
     return test_file
 
-def run_optimization(verilog_file, strategy, trials=20):
-    """运行优化"""
+def design_hash(verilog_file):
+    """计算设计文件的内容哈希，作为 vop.py 的解析缓存键"""
+    return hashlib.blake2b(Path(verilog_file).read_bytes()).hexdigest()
+
+def run_optimization(verilog_file, strategy, trials=20, cache_key=None):
+    """启动优化进程（不阻塞），返回 (Popen, output_dir)"""
     output_dir = f"demo_out_{strategy}"
     cmd = [
         "python", "vop.py",
@@ -49,15 +65,24 @@ def run_optimization(verilog_file, strategy, trials=20):
         "--strategy", strategy,
         "--n-trials", str(trials),
         "--out-dir", output_dir,
-        "--top", "arithmetic_demo"
+        "--top", "arithmetic_demo",
+        "--cache-key", cache_key or design_hash(verilog_file),
+        "--cache-dir", str(CACHE_DIR)
     ]
     
-    print(f"🚀 运行 {strategy} 优化...")
+    print(f"🚀 启动 {strategy} 优化...")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return proc, output_dir
+
+def wait_optimization(proc, deadline):
+    """等待优化进程结束，返回 (success, stdout, stderr)"""
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        return result.returncode == 0, output_dir, result.stdout, result.stderr
+        stdout, stderr = proc.communicate(timeout=max(0, deadline - time.monotonic()))
+        return proc.returncode == 0, stdout, stderr
     except subprocess.TimeoutExpired:
-        return False, output_dir, "", "超时"
+        proc.kill()
+        proc.communicate()
+        return False, "", "超时"
 
 def analyze_result(output_dir, strategy):
     """分析优化结果"""
@@ -80,17 +105,20 @@ def analyze_result(output_dir, strategy):
     
     content = result_file.read_text()
     
-    # 统计特征
-    lines = len(content.splitlines())
-    wires = content.count('wire ')
-    assigns = content.count('assign ')
+    # 统计特征（单次遍历）
+    lines = content.count("\n")
+    if content and not content.endswith("\n"):
+        lines += 1
+    counts = Counter(m.group() for m in FEATURE_PATTERN.finditer(content))
+    wires = counts['wire']
+    assigns = counts['assign']
     
     # 检查是否保留了有意义的信号名
     meaningful_signals = sum([
-        'sum' in content,
-        'product' in content,
-        'mux' in content,
-        content.count('_') < content.count(' ')  # 少用下划线通常意味着更可读
+        counts['sum'] > 0,
+        counts['product'] > 0,
+        counts['mux'] > 0,
+        counts['_'] < counts[' ']  # 少用下划线通常意味着更可读
     ])
     
     print(f"\n📊 {strategy} 策略结果:")
@@ -115,21 +143,23 @@ def analyze_result(output_dir, strategy):
         'file': result_file
     }
 
-def show_code_sample(file_path, max_lines=20):
-    """显示代码示例"""
+def show_code_sample(file_path, max_lines=20, total_lines=None):
+    """显示代码示例（只读取前 max_lines 行；total_lines 可由 analyze_result 传入）"""
     if not file_path or not Path(file_path).exists():
         return
     
-    content = Path(file_path).read_text()
-    lines = content.splitlines()
+    with Path(file_path).open("r", encoding="utf-8") as f:
+        head = [line.rstrip("\r\n") for line in islice(f, max_lines)]
+        if total_lines is None:
+            total_lines = len(head) + sum(1 for _ in f)
     
-    print(f"\n📄 代码示例 (前{min(max_lines, len(lines))}行):")
+    print(f"\n📄 代码示例 (前{len(head)}行):")
     print("─" * 50)
-    for i, line in enumerate(lines[:max_lines], 1):
+    for i, line in enumerate(head, 1):
         print(f"{i:3d}: {line}")
     
-    if len(lines) > max_lines:
-        print(f"... (还有 {len(lines) - max_lines} 行)")
+    if total_lines > max_lines:
+        print(f"... (还有 {total_lines - max_lines} 行)")
 
 def main():
     print("🎯 Verilog优化策略演示")
@@ -138,6 +168,7 @@ def main():
     # 创建测试文件
     test_file = create_test_file()
     print(f"📝 创建测试文件: {test_file}")
+    cache_key = design_hash(test_file)
     
     # 测试不同策略
     strategies = [
@@ -147,22 +178,34 @@ def main():
     
     results = {}
     
-    for strategy, description in strategies:
-        print(f"\n🔧 {description}")
-        print("-" * 40)
-        
-        success, output_dir, stdout, stderr = run_optimization(test_file, strategy)
+    # 各策略相互独立，同时启动（不超过 CPU 核数），再依次收集结果
+    max_procs = os.cpu_count() or 1
+    pending = list(strategies)
+    while pending:
+        batch, pending = pending[:max_procs], pending[max_procs:]
+        procs = {strategy: run_optimization(test_file, strategy, cache_key=cache_key)
+                 for strategy, _ in batch}
+        deadline = time.monotonic() + OPTIMIZATION_TIMEOUT
+        finished = {strategy: wait_optimization(proc, deadline)
+                    for strategy, (proc, _) in procs.items()}
         
-        if success:
-            result = analyze_result(output_dir, strategy)
-            results[strategy] = result
+        for strategy, description in batch:
+            print(f"\n🔧 {description}")
+            print("-" * 40)
+            
+            output_dir = procs[strategy][1]
+            success, stdout, stderr = finished[strategy]
             
-            # 显示代码示例
-            if result and result['file']:
-                show_code_sample(result['file'], 15)
-        else:
-            print(f"❌ {strategy} 优化失败:")
-            print(f"   {stderr}")
+            if success:
+                result = analyze_result(output_dir, strategy)
+                results[strategy] = result
+                
+                # 显示代码示例
+                if result and result['file']:
+                    show_code_sample(result['file'], 15, result['lines'])
+            else:
+                print(f"❌ {strategy} 优化失败:")
+                print(f"   {stderr}")
     
     # 对比结果
     print("\n" + "=" * 60)
@@ -4,7 +4,9 @@
 """
 
 import optuna
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
 
 class SmartOptimizer:
@@ -40,13 +42,21 @@ class SmartOptimizer:
         return self.no_improvement_count >= self.patience
 
 def optimize_with_early_stopping(objective_func, max_trials: int = 200, 
-                                patience: int = 20, timeout: int = 1800):
+                                patience: int = 20, timeout: int = 1800,
+                                show_progress_bar: Optional[bool] = None,
+                                n_jobs: int = 1):
     """
     带早停的优化
     max_trials: 最大试验次数
     patience: 耐心值（连续无改进次数）
     timeout: 最大运行时间（秒）
+    show_progress_bar: 是否显示进度条，默认仅在交互式终端中显示（仅串行模式）
+    n_jobs: 每批并行评估的试验数，>1 时用 ask/tell 成批采样并在线程池中并发评估
+            （适合调用 vop.py 子进程等释放GIL的目标函数）
     """
+    if show_progress_bar is None:
+        show_progress_bar = sys.stderr.isatty()
+    
     print(f"🚀 开始智能优化 (最大{max_trials}次试验, {patience}次无改进自动停止)")
     
     optimizer = SmartOptimizer(patience=patience)
@@ -55,36 +65,59 @@ def optimize_with_early_stopping(objective_func, max_trials: int = 200,
     
     start_time = time.time()
     trial_count = 0
+    current_best = float('inf')  # 自行维护最佳值，避免每次试验读取 study.best_value 遍历全部试验
     
-    def smart_objective(trial):
-        nonlocal trial_count
+    def log_trial(result: float):
+        """记录一次试验结果"""
+        nonlocal trial_count, current_best
         trial_count += 1
+        current_best = min(current_best, result)
         
-        result = objective_func(trial)
-        current_best = study.best_value if study.best_trial else float('inf')
-        
-        # 检查早停条件
         elapsed_time = time.time() - start_time
-        
         print(f"试验 {trial_count}/{max_trials}: 当前值={result:.2f}, "
               f"最佳值={current_best:.2f}, 用时={elapsed_time:.1f}s")
-        
-        # 检查各种停止条件
+    
+    def check_stop() -> bool:
+        """检查各种停止条件"""
+        elapsed_time = time.time() - start_time
         if elapsed_time > timeout:
             print(f"⏱️  达到时间限制 ({timeout}s)")
-            study.stop()
-        elif trial_count >= max_trials:
+            return True
+        if trial_count >= max_trials:
             print(f"🔢 达到最大试验次数 ({max_trials})")
-            study.stop()
-        elif optimizer.should_stop(current_best):
+            return True
+        if optimizer.should_stop(current_best):
             print(f"🎯 连续{patience}次无显著改进，自动停止")
+            return True
+        return False
+    
+    def smart_objective(trial):
+        result = objective_func(trial)
+        log_trial(result)
+        if check_stop():
             study.stop()
-            
         return result
     
     try:
-        study.optimize(smart_objective, n_trials=max_trials, 
-                      show_progress_bar=True, timeout=timeout)
+        if n_jobs > 1:
+            # 成批 ask → 并发评估 → 逐个 tell，早停条件每批检查一次
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                while True:
+                    trials = [study.ask() for _ in range(min(n_jobs, max_trials - trial_count))]
+                    futures = [executor.submit(objective_func, trial) for trial in trials]
+                    for trial, future in zip(trials, futures):
+                        try:
+                            result = future.result()
+                        except Exception:
+                            study.tell(trial, state=optuna.trial.TrialState.FAIL)
+                            raise
+                        study.tell(trial, result)
+                        log_trial(result)
+                    if check_stop():
+                        break
+        else:
+            study.optimize(smart_objective, n_trials=max_trials, 
+                          show_progress_bar=show_progress_bar, timeout=timeout)
     except KeyboardInterrupt:
         print("🛑 用户中断优化")
     
@@ -131,7 +164,7 @@ if __name__ == "__main__":
     # 模拟优化函数
     def dummy_objective(trial):
         import random
-        time.sleep(0.1)  # 模拟优化时间
+        sum(i * i for i in range(1000))  # 固定计算量，避免 sleep 掩盖采样器开销
         return random.random() + 0.001 * trial.number  # 随时间递减
     
     # 自动建议试验次数
@@ -3,21 +3,39 @@
 快速测试Verilog优化API服务
 """
 
+import random
 import requests
 import time
 import json
 
+# JSON解码：优先使用 orjson (C 实现)，未安装时回退到标准库
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 def test_api():
     """测试API服务"""
     base_url = "http://localhost:8000"
     
+    # 健康检查、提交任务和所有状态轮询共用一个 keep-alive 连接
+    session = requests.Session()
+    session.headers["Connection"] = "keep-alive"
+    try:
+        return run_tests(session, base_url)
+    finally:
+        session.close()
+
+def run_tests(session, base_url):
+    """依次执行各项测试"""
     print("🧪 快速测试Verilog优化API")
     print("========================")
     
     # 1. 健康检查
     print("🔍 检查服务状态...")
     try:
-        response = requests.get(f"{base_url}/health", timeout=5)
+        response = session.get(f"{base_url}/health", timeout=5)
         if response.status_code == 200:
             print("✅ API服务正常运行")
         else:
@@ -49,7 +67,7 @@ endmodule
     }
     
     try:
-        response = requests.post(
+        response = session.post(
             f"{base_url}/optimize",
             json=optimize_request,
             timeout=10
@@ -59,7 +77,7 @@ endmodule
             print(f"❌ 提交任务失败: {response.text}")
             return False
             
-        job_info = response.json()
+        job_info = json_loads(response.content)
         job_id = job_info["job_id"]
         print(f"✅ 任务提交成功，ID: {job_id}")
         
@@ -67,51 +85,79 @@ endmodule
         print("⏳ 等待优化完成...")
         max_wait = 120  # 最多等待2分钟
         start_time = time.time()
+        failures = 0  # 连续失败次数，用于指数退避
+        last_state = None  # 状态未变化时不重复打印
         
         while time.time() - start_time < max_wait:
-            status_response = requests.get(f"{base_url}/status/{job_id}")
-            if status_response.status_code == 200:
-                status = status_response.json()
-                print(f"📊 状态: {status['status']} - {status['message']}")
-                
-                if status['status'] == 'completed':
-                    # 获取结果
-                    result_response = requests.get(f"{base_url}/result/{job_id}")
-                    if result_response.status_code == 200:
-                        result = result_response.json()
-                        print("✅ 优化完成!")
-                        
-                        if result.get('optimization_stats'):
-                            stats = result['optimization_stats']
-                            print(f"📈 统计信息:")
-                            print(f"   策略: {stats.get('strategy_used')}")
-                            print(f"   原始行数: {stats.get('original_lines')}")
-                            print(f"   优化行数: {stats.get('optimized_lines')}")
-                            print(f"   执行时间: {result.get('execution_time', 0):.1f}秒")
-                        
-                        if result.get('optimized_code'):
-                            print(f"\n📄 优化后代码预览:")
-                            lines = result['optimized_code'].splitlines()
-                            for i, line in enumerate(lines[:10], 1):
-                                print(f"   {i:2d}: {line}")
-                            if len(lines) > 10:
-                                print(f"   ... (还有{len(lines)-10}行)")
-                        
-                        return True
-                    else:
-                        print("❌ 获取结果失败")
-                        return False
-                        
-                elif status['status'] == 'failed':
-                    print("❌ 优化失败")
-                    result_response = requests.get(f"{base_url}/result/{job_id}")
-                    if result_response.status_code == 200:
-                        error_details = result_response.json().get('error_details')
-                        if error_details:
-                            print(f"错误详情: {error_details}")
+            try:
+                # 长轮询：服务端在状态变化或超时后返回；等待时间在服务端上限30秒以下随机抖动（27~30秒）
+                wait = round(30 * random.uniform(0.9, 1.0), 1)
+                status_response = session.get(
+                    f"{base_url}/status/{job_id}",
+                    params={"wait": wait},
+                    timeout=wait + 5
+                )
+                status_response.raise_for_status()
+            except requests.RequestException as e:
+                failures += 1
+                if failures >= 5:
+                    print(f"❌ 查询状态失败: {e}")
                     return False
+                # 指数退避加随机抖动，避免服务重启时集中重试
+                delay = min(30, 0.5 * 2 ** failures) * random.uniform(0.5, 1.5)
+                print(f"⚠️  查询状态失败，{delay:.1f}秒后重试...")
+                time.sleep(delay)
+                continue
             
-            time.sleep(3)  # 等待3秒再查询
+            failures = 0
+            status = json_loads(status_response.content)  # 每个响应体只解析一次
+            state = status['status']
+            current = (state, status.get('message'))
+            if current != last_state:
+                print(f"📊 状态: {state} - {current[1]}")
+                last_state = current
+            
+            if state == 'completed':
+                # 获取结果
+                # 只预览前10行，服务端截断后再返回
+                result_response = session.get(f"{base_url}/result/{job_id}", params={"preview": 10})
+                if result_response.status_code == 200:
+                    result = json_loads(result_response.content)
+                    print("✅ 优化完成!")
+                    
+                    if result.get('optimization_stats'):
+                        stats = result['optimization_stats']
+                        print(f"📈 统计信息:")
+                        print(f"   策略: {stats.get('strategy_used')}")
+                        print(f"   原始行数: {stats.get('original_lines')}")
+                        print(f"   优化行数: {stats.get('optimized_lines')}")
+                        print(f"   执行时间: {result.get('execution_time', 0):.1f}秒")
+                    
+                    if result.get('optimized_code'):
+                        print(f"\n📄 优化后代码预览:")
+                        lines = result['optimized_code'].splitlines()
+                        for i, line in enumerate(lines, 1):
+                            print(f"   {i:2d}: {line}")
+                        if result.get('code_truncated'):
+                            total_lines = (result.get('optimization_stats') or {}).get('optimized_stats', {}).get('total_lines')
+                            if total_lines:
+                                print(f"   ... (还有{total_lines - len(lines)}行)")
+                            else:
+                                print("   ...")
+                    
+                    return True
+                else:
+                    print("❌ 获取结果失败")
+                    return False
+                    
+            elif state == 'failed':
+                print("❌ 优化失败")
+                result_response = session.get(f"{base_url}/result/{job_id}")
+                if result_response.status_code == 200:
+                    error_details = json_loads(result_response.content).get('error_details')
+                    if error_details:
+                        print(f"错误详情: {error_details}")
+                return False
         
         print("❌ 优化超时")
         return False
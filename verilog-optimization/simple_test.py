@@ -3,29 +3,55 @@
 简单的API测试脚本 - 不依赖额外库
 """
 
-import urllib.request
+import gzip
+import http.client
 import urllib.parse
 import json
+import random
 import time
 
+def request_json(conn: http.client.HTTPConnection, method: str, path: str, body=None, headers=None):
+    """在复用的keep-alive连接上发送请求并解析JSON响应
+    
+    响应体必须完整读取，连接才能用于下一个请求
+    """
+    headers = dict(headers or {})
+    headers.setdefault("Accept-Encoding", "gzip")  # 大段结果代码由服务端压缩返回
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    data = response.read()
+    if response.getheader("Content-Encoding") == "gzip":
+        data = gzip.decompress(data)
+    if response.status >= 400:
+        raise Exception(f"HTTP {response.status}: {data.decode(errors='replace')}")
+    return json.loads(data.decode())
+
 def test_api():
     """测试API基本功能"""
     base_url = "http://localhost:8000"
     
+    # 所有请求共用一个TCP连接，避免每次查询重新握手
+    url = urllib.parse.urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=35)
+    try:
+        return run_tests(conn)
+    finally:
+        conn.close()
+
+def run_tests(conn: http.client.HTTPConnection):
+    """依次执行健康检查、提交任务、等待结果"""
     print("🧪 简单API测试")
     print("=============")
     
     try:
         # 1. 健康检查
         print("🔍 检查API服务...")
-        health_url = f"{base_url}/health"
-        with urllib.request.urlopen(health_url) as response:
-            health_data = json.loads(response.read().decode())
-            if health_data.get("status") == "healthy":
-                print("✅ API服务正常")
-            else:
-                print("❌ API服务状态异常")
-                return False
+        health_data = request_json(conn, "GET", "/health")
+        if health_data.get("status") == "healthy":
+            print("✅ API服务正常")
+        else:
+            print("❌ API服务状态异常")
+            return False
     
     except Exception as e:
         print(f"❌ 无法连接API服务: {e}")
@@ -45,18 +71,14 @@ def test_api():
         }
         
         # 发送POST请求
-        optimize_url = f"{base_url}/optimize"
         json_data = json.dumps(test_data).encode('utf-8')
         
-        req = urllib.request.Request(
-            optimize_url,
-            data=json_data,
+        result = request_json(
+            conn, "POST", "/optimize",
+            body=json_data,
             headers={'Content-Type': 'application/json'}
         )
         
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode())
-            
         job_id = result.get("job_id")
         if not job_id:
             print(f"❌ 未获取到job_id: {result}")
@@ -68,24 +90,26 @@ def test_api():
         print("⏳ 等待任务完成...")
         max_wait = 60
         start_time = time.time()
+        last_state = None  # 状态未变化时不重复打印
         
         while time.time() - start_time < max_wait:
-            status_url = f"{base_url}/status/{job_id}"
+            # 长轮询：服务端在状态变化或超时后返回；等待时间在服务端上限30秒以下随机抖动（27~30秒）
+            wait = round(30 * random.uniform(0.9, 1.0), 1)
+            status_path = f"/status/{job_id}?wait={wait}"
             
             try:
-                with urllib.request.urlopen(status_url) as response:
-                    status_data = json.loads(response.read().decode())
-                    
+                status_data = request_json(conn, "GET", status_path)
+                
                 status = status_data.get("status")
                 message = status_data.get("message")
                 
-                print(f"📊 状态: {status} - {message}")
+                if (status, message) != last_state:
+                    print(f"📊 状态: {status} - {message}")
+                    last_state = (status, message)
                 
                 if status == "completed":
                     # 获取结果
-                    result_url = f"{base_url}/result/{job_id}"
-                    with urllib.request.urlopen(result_url) as response:
-                        result_data = json.loads(response.read().decode())
+                    result_data = request_json(conn, "GET", f"/result/{job_id}")
                     
                     print("✅ 优化完成!")
                     
@@ -110,8 +134,6 @@ def test_api():
             except Exception as e:
                 print(f"❌ 查询状态失败: {e}")
                 return False
-            
-            time.sleep(3)
         
         print("❌ 任务超时")
         return False
@@ -3,11 +3,18 @@
 对比不同优化策略的效果
 """
 
+import mmap
+import os
+import re
 import subprocess
-import tempfile
+from collections import Counter
+from itertools import islice
 from pathlib import Path
+from typing import Dict, List, Optional
 import shutil
 
+from vop_test_utils import VOP_CMD, discard_dir, result_cache_dir, run_logged, stage_design
+
 # 更复杂的测试设计，有明显的优化空间
 COMPLEX_DESIGN = """
 module complex_test (
@@ -41,89 +48,154 @@ module complex_test (
 endmodule
 """
 
-def run_strategy_test(verilog_file: str, strategy: str, trials: int = 20):
-    """运行特定策略的优化并返回结果信息"""
-    output_dir = f"compare_out_{strategy}"
-    
-    # 清理旧的输出目录
-    if Path(output_dir).exists():
-        shutil.rmtree(output_dir)
-    
-    cmd = [
-        "python", "vop.py",
-        verilog_file,
-        "--strategy", strategy,
-        "--n-trials", str(trials),
-        "--out-dir", output_dir,
-        "--top", "complex_test"
+# 一次扫描收集分析所需的全部特征（wire/assign 后的空格用前瞻匹配，与 count('wire ') 结果一致）
+STATS_PATTERN = re.compile(r"(?:wire|assign)(?= )|temp[12]|a \+ b|complex_test|\n")
+
+STATS_PATTERN_BYTES = re.compile(STATS_PATTERN.pattern.encode())
+
+def scan_content(content) -> Counter:
+    """单次遍历统计 wire/assign 数、行数及各特征串的出现次数（str 或 bytes/mmap 均可）"""
+    if isinstance(content, str):
+        counts = Counter(m.group() for m in STATS_PATTERN.finditer(content))
+        ends_with_newline = content.endswith('\n')
+    else:
+        raw = Counter(m.group() for m in STATS_PATTERN_BYTES.finditer(content))
+        counts = Counter({token.decode(): n for token, n in raw.items()})
+        ends_with_newline = content[-1:] == b'\n'
+    counts['lines'] = counts['\n'] + (1 if len(content) and not ends_with_newline else 0)
+    return counts
+
+def scan_file(path: Path) -> Counter:
+    """通过 mmap 直接在文件字节上统计，不把整个输出读成 Python 字符串"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return scan_content("")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return scan_content(mm)
+
+def head_lines(path: Path, n: int) -> List[str]:
+    """只读取文件的前 n 行"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.rstrip('\r\n') for line in islice(f, n)]
+
+OUT_DIR_PREFIX = "compare_out_"
+STRATEGY_TIMEOUT = 120  # 每个策略的时间预算（秒），批量运行时按策略数放大
+
+def find_result_file(output_dir: str):
+    """在输出目录中查找优化结果文件"""
+    output_path = Path(output_dir)
+    possible_files = [
+        output_path / "best_opt.v",
+        output_path / "baseline_readable.v",
+        output_path / "baseline_minimal.v"
     ]
     
-    print(f"🔧 测试 {strategy} 策略...")
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        
-        if result.returncode == 0:
-            # 查找输出文件
-            output_path = Path(output_dir)
-            possible_files = [
-                output_path / "best_opt.v",
-                output_path / "baseline_readable.v",
-                output_path / "baseline_minimal.v"
-            ]
-            
-            result_file = None
-            for f in possible_files:
-                if f.exists():
-                    result_file = f
-                    break
-            
-            if result_file:
-                content = result_file.read_text()
-                return {
-                    'success': True,
-                    'file': result_file,
-                    'content': content,
-                    'lines': len(content.splitlines()),
-                    'wires': content.count('wire '),
-                    'assigns': content.count('assign '),
-                    'stdout': result.stdout
-                }
+    for f in possible_files:
+        if f.exists():
+            return f
+    return None
+
+def run_strategy_tests(verilog_file: str, strategies: List[str], trials: int = 20) -> Dict[str, dict]:
+    """用一次 vop.py 调用（批量模式）运行所有策略，返回 {策略: 结果信息}
+    
+    只启动一个解释器、只导入一次 optuna；各策略在 vop.py 内并发执行
+    """
+    to_run = []
+    caches = {}
+    for strategy in strategies:
+        # 清理旧的输出目录
+        output_dir = f"{OUT_DIR_PREFIX}{strategy}"
+        discard_dir(output_dir)
         
-        return {
-            'success': False,
-            'error': result.stderr,
-            'stdout': result.stdout
-        }
+        cache = caches[strategy] = result_cache_dir(verilog_file, strategy, trials)
+        if cache and find_result_file(str(cache)):
+            print(f"♻️  {strategy} 策略命中缓存: {cache}")
+            shutil.copytree(cache, output_dir)
+        else:
+            to_run.append(strategy)
+    
+    returncode, log = None, ""
+    if to_run:
+        cmd = [
+            *VOP_CMD,
+            verilog_file,
+            "--strategies", ",".join(to_run),
+            "--n-trials", str(trials),
+            "--out-dir-prefix", OUT_DIR_PREFIX,
+            "--top", "complex_test"
+        ]
         
-    except subprocess.TimeoutExpired:
-        return {'success': False, 'error': '超时'}
+        print(f"🔧 测试策略: {', '.join(to_run)}...")
+        try:
+            returncode, log = run_logged(cmd, timeout=STRATEGY_TIMEOUT * len(to_run))
+        except subprocess.TimeoutExpired:
+            log = '超时'
+    
+    results = {}
+    for strategy in strategies:
+        # 某个策略失败不影响其他策略的结果
+        output_dir = f"{OUT_DIR_PREFIX}{strategy}"
+        best_file = Path(output_dir) / "best_opt.v"
+        if strategy not in to_run:
+            result_file = find_result_file(output_dir)  # 命中缓存
+        elif best_file.exists() and f"Strategy {strategy} failed" not in log:
+            # best_opt.v 在搜索完成后才写出，只有它算作（并缓存为）该策略的优化结果
+            result_file = best_file
+            if caches[strategy]:
+                caches[strategy].mkdir(parents=True, exist_ok=True)
+                shutil.copy2(result_file, caches[strategy] / result_file.name)
+        elif returncode == 0:
+            # 正常结束但没有写出 best_opt.v（如 minimal 回退到基线）：基线即为该策略的输出
+            result_file = find_result_file(output_dir)
+        else:
+            # 崩溃或超时：搜索开始前写出的基线文件不能当作成功
+            result_file = None
+        if result_file:
+            # 不保留文件内容：统计走 mmap，预览时再按需读取前几行
+            stats = scan_file(result_file)
+            results[strategy] = {
+                'success': True,
+                'file': result_file,
+                'stats': stats,
+                'lines': stats['lines'],
+                'wires': stats['wire'],
+                'assigns': stats['assign'],
+                'stdout': log
+            }
+        else:
+            results[strategy] = {
+                'success': False,
+                'error': log
+            }
+    return results
+
+def run_strategy_test(verilog_file: str, strategy: str, trials: int = 20):
+    """运行特定策略的优化并返回结果信息"""
+    return run_strategy_tests(verilog_file, [strategy], trials)[strategy]
 
-def analyze_optimization(original_content: str, optimized_content: str, strategy: str):
-    """分析优化效果"""
+def analyze_optimization(orig: Counter, opt: Counter, strategy: str):
+    """分析优化效果；orig/opt 为原始设计与优化结果的 scan_content 统计"""
     print(f"\n📊 {strategy} 策略分析:")
     print("-" * 50)
     
-    orig_lines = len(original_content.splitlines())
-    opt_lines = len(optimized_content.splitlines())
-    orig_wires = original_content.count('wire ')
-    opt_wires = optimized_content.count('wire ')
-    orig_assigns = original_content.count('assign ')
-    opt_assigns = optimized_content.count('assign ')
+    orig_lines, opt_lines = orig['lines'], opt['lines']
+    orig_wires, opt_wires = orig['wire'], opt['wire']
+    orig_assigns, opt_assigns = orig['assign'], opt['assign']
     
     print(f"📏 行数:      {orig_lines} → {opt_lines} ({opt_lines-orig_lines:+d})")
     print(f"🔗 Wire数:    {orig_wires} → {opt_wires} ({opt_wires-orig_wires:+d})")
     print(f"➡️  Assign数: {orig_assigns} → {opt_assigns} ({opt_assigns-orig_assigns:+d})")
     
     # 检查特定的优化效果
-    if 'temp1' in original_content and 'temp1' not in optimized_content:
+    if orig['temp1'] and not opt['temp1']:
         print("✅ 消除了冗余的temp1信号")
-    if 'temp2' in original_content and 'temp2' not in optimized_content:
+    if orig['temp2'] and not opt['temp2']:
         print("✅ 消除了重复的temp2信号")
-    if original_content.count('a + b') > optimized_content.count('a + b'):
+    if orig['a + b'] > opt['a + b']:
         print("✅ 优化了重复的加法表达式")
     
     # 检查可读性
-    if opt_wires < 20 and 'complex_test' in optimized_content:
+    if opt_wires < 20 and opt['complex_test']:
         print("📖 保持了良好的可读性")
     elif opt_wires > 100:
         print("⚠️  生成了大量内部信号，可读性较差")
@@ -134,13 +206,16 @@ def analyze_optimization(original_content: str, optimized_content: str, strategy
         'assign_change': opt_assigns - orig_assigns
     }
 
-def show_code_comparison(original: str, optimized: str, strategy: str, max_lines: int = 20):
-    """显示代码对比"""
+def show_code_comparison(original: str, optimized_file: Path, strategy: str, max_lines: int = 20,
+                         total_lines: Optional[int] = None):
+    """显示代码对比；优化结果只读取预览所需的前几行，total_lines 为其总行数"""
     print(f"\n📄 {strategy} 策略代码对比:")
     print("=" * 60)
     
     orig_lines = original.splitlines()
-    opt_lines = optimized.splitlines()
+    opt_lines = head_lines(optimized_file, 15)
+    if total_lines is None:
+        total_lines = scan_file(optimized_file)['lines']
     
     print("🔹 原始代码 (前15行):")
     print("-" * 30)
@@ -152,17 +227,15 @@ def show_code_comparison(original: str, optimized: str, strategy: str, max_lines
     for i, line in enumerate(opt_lines[:15], 1):
         print(f"{i:2d}: {line}")
     
-    if len(opt_lines) > 15:
-        print(f"... (还有 {len(opt_lines) - 15} 行)")
+    if total_lines > 15:
+        print(f"... (还有 {total_lines - 15} 行)")
 
 def main():
     print("🧪 全面对比不同优化策略")
     print("=" * 60)
     
     # 创建测试文件
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.v', delete=False) as f:
-        f.write(COMPLEX_DESIGN)
-        test_file = f.name
+    test_file = stage_design("complex_test.v", COMPLEX_DESIGN)
     
     print(f"📝 创建复杂测试设计: {test_file}")
     print("包含冗余表达式、重复信号、可优化的多路选择器")
@@ -176,19 +249,23 @@ def main():
     
     results = {}
     original_content = COMPLEX_DESIGN
+    orig_stats = scan_content(original_content)  # 原始设计只统计一次
+    
+    # 所有策略用一次 vop.py 调用完成（批量模式，内部并发），再按顺序汇报
+    batch = run_strategy_tests(test_file, [s for s, _ in strategies], 30)  # 增加试验次数
     
     for strategy, description in strategies:
         print(f"\n{'='*20} {description} {'='*20}")
-        result = run_strategy_test(test_file, strategy, 30)  # 增加试验次数
+        result = batch[strategy]
         
         if result['success']:
             results[strategy] = result
             
             # 分析优化效果
-            analysis = analyze_optimization(original_content, result['content'], strategy)
+            analysis = analyze_optimization(orig_stats, result['stats'], strategy)
             
             # 显示代码对比
-            show_code_comparison(original_content, result['content'], strategy)
+            show_code_comparison(original_content, result['file'], strategy, total_lines=result['lines'])
             
         else:
             print(f"❌ {strategy} 优化失败:")
@@ -221,7 +298,7 @@ def main():
     print("⚠️  面积优化: python vop.py design.v --strategy aig (但代码难读)")
     
     # 清理
-    Path(test_file).unlink()
+    Path(test_file).unlink(missing_ok=True)
     print(f"\n🧹 清理测试文件: {test_file}")
 
 if __name__ == "__main__":
@@ -4,9 +4,10 @@
 """
 
 import subprocess
-import tempfile
 from pathlib import Path
 
+from vop_test_utils import VOP_CMD, run_logged, stage_design
+
 # 简单的测试设计
 SIMPLE_DESIGN = """
 module simple_test (
@@ -24,14 +25,12 @@ def test_minimal_strategy():
     print("🧪 测试 minimal 优化策略...")
     
     # 创建测试文件
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.v', delete=False) as f:
-        f.write(SIMPLE_DESIGN)
-        test_file = f.name
+    test_file = stage_design("simple_test.v", SIMPLE_DESIGN)
     
     try:
         # 运行minimal优化
         cmd = [
-            "python", "vop.py", 
+            *VOP_CMD,
             test_file,
             "--strategy", "minimal",
             "--n-trials", "5",  # 快速测试
@@ -39,9 +38,9 @@ def test_minimal_strategy():
         ]
         
         print("🔧 运行优化...")
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        returncode, log = run_logged(cmd, timeout=60)
         
-        if result.returncode == 0:
+        if returncode == 0:
             print("✅ 优化成功!")
             
             # 检查输出文件
@@ -83,14 +82,14 @@ def test_minimal_strategy():
                         
         else:
             print("❌ 优化失败:")
-            print(result.stderr)
+            print(log)
             
     except subprocess.TimeoutExpired:
         print("❌ 优化超时")
         
     finally:
         # 清理
-        Path(test_file).unlink()
+        Path(test_file).unlink(missing_ok=True)
 
 if __name__ == "__main__":
     test_minimal_strategy() 
\ No newline at end of file
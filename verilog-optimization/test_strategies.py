@@ -3,10 +3,15 @@
 测试不同优化策略的效果对比
 """
 
+import asyncio
+import re
+import shutil
 import subprocess
-import tempfile
+from collections import Counter
 from pathlib import Path
 
+from vop_test_utils import VOP_CMD, discard_dir, result_cache_dir, run_logged, stage_design
+
 # 创建一个测试用的Verilog设计
 TEST_DESIGN = """
 module test_design (
@@ -25,21 +30,51 @@ module test_design (
 endmodule
 """
 
-def run_strategy(verilog_file: str, strategy: str, output_dir: str):
-    """运行特定策略的优化"""
+# 一次扫描收集分析所需的全部特征（wire/assign 后的空格用前瞻匹配，与 count('wire ') 结果一致）
+STATS_PATTERN = re.compile(r"(?:wire|assign)(?= )|sum|product|\n")
+
+STRATEGY_TIMEOUT = 60  # 每个策略独立计时（秒）
+
+OUT_DIR_PREFIX = "test_out_"
+N_TRIALS = 10  # 快速测试
+RESULT_FILES = ("best_opt.v", "baseline_readable.v")
+
+async def run_strategy(verilog_file: str, strategy: str, output_dir: str):
+    """运行特定策略的优化，返回 (是否成功, 日志末尾)
+    
+    每个策略是独立的 vop.py 进程、独立超时，卡住的策略不会拖住其他策略
+    """
+    # 清理旧输出，避免把上次的结果当作本次成功
+    discard_dir(output_dir)
+    
+    cache = result_cache_dir(verilog_file, strategy, N_TRIALS)
+    if cache and any((cache / name).exists() for name in RESULT_FILES):
+        print(f"♻️  {strategy} 策略命中缓存: {cache}")
+        shutil.copytree(cache, output_dir)
+        return True, ""
+    
     cmd = [
-        "python", "vop.py", 
-        verilog_file, 
+        *VOP_CMD,
+        verilog_file,
         "--strategy", strategy,
-        "--n-trials", "10",  # 快速测试
+        "--n-trials", str(N_TRIALS),
         "--out-dir", output_dir
     ]
     
+    # 在线程中等待，各策略的 vop.py 进程并发运行；超时时 run_logged 会结束整个进程组
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-        return result.returncode == 0, result.stdout, result.stderr
+        returncode, log = await asyncio.to_thread(run_logged, cmd, STRATEGY_TIMEOUT)
     except subprocess.TimeoutExpired:
-        return False, "", "Timeout"
+        return False, "Timeout"
+    
+    if cache:
+        for name in RESULT_FILES:
+            output_file = Path(output_dir) / name
+            if output_file.exists():
+                cache.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(output_file, cache / name)
+    
+    return returncode == 0, log
 
 def analyze_output(file_path: str):
     """分析输出文件的特征"""
@@ -49,12 +84,14 @@ def analyze_output(file_path: str):
     with open(file_path, 'r') as f:
         content = f.read()
     
-    lines = len(content.splitlines())
-    wires = content.count('wire ')
-    assigns = content.count('assign ')
+    # 单次遍历统计
+    counts = Counter(m.group() for m in STATS_PATTERN.finditer(content))
+    lines = counts['\n'] + (1 if content and not content.endswith('\n') else 0)
+    wires = counts['wire']
+    assigns = counts['assign']
     
     # 简单的可读性评估
-    has_meaningful_names = 'sum' in content or 'product' in content
+    has_meaningful_names = counts['sum'] > 0 or counts['product'] > 0
     low_wire_count = wires < 50
     readable = has_meaningful_names and low_wire_count
     
@@ -66,11 +103,9 @@ def analyze_output(file_path: str):
         "size_kb": len(content) / 1024
     }
 
-def main():
+async def main():
     # 创建测试文件
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.v', delete=False) as f:
-        f.write(TEST_DESIGN)
-        test_file = f.name
+    test_file = stage_design("test_design.v", TEST_DESIGN)
     
     strategies = ["readable", "aig", "balanced", "yosys_only"]
     results = {}
@@ -78,11 +113,14 @@ def main():
     print("🧪 测试不同优化策略...")
     print("=" * 60)
     
-    for strategy in strategies:
+    # 各策略同时运行、各自超时，结果按策略顺序输出
+    outcomes = await asyncio.gather(*(
+        run_strategy(test_file, strategy, f"{OUT_DIR_PREFIX}{strategy}") for strategy in strategies
+    ))
+    
+    for strategy, (success, log) in zip(strategies, outcomes):
         print(f"\n🔄 测试策略: {strategy}")
-        output_dir = f"test_out_{strategy}"
-        
-        success, stdout, stderr = run_strategy(test_file, strategy, output_dir)
+        output_dir = f"{OUT_DIR_PREFIX}{strategy}"
         
         if success:
             output_file = Path(output_dir) / "best_opt.v"
@@ -98,7 +136,7 @@ def main():
             else:
                 print(f"   📖 可读性: 较差")
         else:
-            print(f"❌ 失败: {stderr}")
+            print(f"❌ 失败: {log}")
             results[strategy] = None
     
     # 汇总比较
@@ -124,7 +162,7 @@ def main():
             print("⚠️  'aig' 策略产生了大量内部信号，建议避免使用")
     
     # 清理测试文件
-    Path(test_file).unlink()
+    Path(test_file).unlink(missing_ok=True)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main()) 
\ No newline at end of file
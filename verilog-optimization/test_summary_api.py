@@ -8,6 +8,16 @@ import json
 
 def test_optimization_summary():
     """测试优化总结功能"""
+    # 健康检查、提交、状态轮询和获取结果共用一个 keep-alive 连接
+    session = requests.Session()
+    session.headers["Connection"] = "keep-alive"
+    try:
+        run_summary_test(session)
+    finally:
+        session.close()
+
+def run_summary_test(session):
+    """依次执行提交、等待和结果检查"""
     
     # API配置
     api_url = "http://localhost:8001"
@@ -39,7 +49,7 @@ endmodule
     
     # 检查API服务
     try:
-        response = requests.get(f"{api_url}/health")
+        response = session.get(f"{api_url}/health")
         if response.status_code != 200:
             print("❌ API服务不可用")
             return
@@ -57,7 +67,7 @@ endmodule
     }
     
     try:
-        response = requests.post(f"{api_url}/optimize", json=optimize_data)
+        response = session.post(f"{api_url}/optimize", json=optimize_data)
         if response.status_code != 200:
             print(f"❌ 提交任务失败: {response.text}")
             return
@@ -72,9 +82,12 @@ endmodule
     
     # 等待任务完成
     print("\n⏳ 等待任务完成...")
+    delay = 0.05  # 状态未变化时的退避间隔，兼容不支持长轮询的服务端
+    last_state = None
     while True:
         try:
-            response = requests.get(f"{api_url}/status/{job_id}")
+            # 长轮询：服务端在状态变化或30秒超时后返回
+            response = session.get(f"{api_url}/status/{job_id}", params={"wait": 30}, timeout=35)
             if response.status_code != 200:
                 print(f"❌ 查询状态失败: {response.text}")
                 return
@@ -84,8 +97,14 @@ endmodule
             
             if status['status'] in ['completed', 'failed']:
                 break
-                
-            time.sleep(2)
+            
+            state = (status['status'], status['message'])
+            if state != last_state:
+                last_state = state
+                delay = 0.05
+            else:
+                time.sleep(delay)
+                delay = min(delay * 1.7, 2.0)
             
         except Exception as e:
             print(f"❌ 查询状态出错: {e}")
@@ -94,7 +113,7 @@ endmodule
     # 获取优化结果
     print("\n📋 获取优化结果...")
     try:
-        response = requests.get(f"{api_url}/result/{job_id}")
+        response = session.get(f"{api_url}/result/{job_id}")
         if response.status_code != 200:
             print(f"❌ 获取结果失败: {response.text}")
             return
@@ -131,16 +150,22 @@ endmodule
                 print(f"  代码行数: {orig['total_lines']} → {opt['total_lines']} (减少 {stats.get('line_reduction', 0)})")
                 print(f"  信号线数: {orig['wire_count']} → {opt['wire_count']} (减少 {stats.get('wire_reduction', 0)})")
         
-        # 显示代码对比（简要）
+        # 显示代码对比（简要）：行数优先使用服务端已统计的结果
         print("\n📄 代码对比:")
-        print("原始代码行数:", len(test_verilog.splitlines()))
-        if result.get('optimized_code'):
-            print("优化后行数:", len(result['optimized_code'].splitlines()))
+        stats = result.get('optimization_stats') or {}
+        orig_total = stats.get('original_stats', {}).get('total_lines')
+        print("原始代码行数:", orig_total if orig_total is not None else test_verilog.count('\n') + 1)
+        optimized_code = result.get('optimized_code')
+        if optimized_code:
+            opt_total = stats.get('optimized_stats', {}).get('total_lines')
+            if opt_total is None:
+                opt_total = optimized_code.count('\n') + 1
+            print("优化后行数:", opt_total)
             print("📝 优化后代码预览（前10行）:")
             print("-" * 40)
-            for i, line in enumerate(result['optimized_code'].splitlines()[:10], 1):
+            for i, line in enumerate(optimized_code.split('\n', 10)[:10], 1):
                 print(f"{i:2d}: {line}")
-            if len(result['optimized_code'].splitlines()) > 10:
+            if opt_total > 10:
                 print("    ... (更多代码)")
         
         print("\n✅ 测试完成!")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+测试优化任务超时后任务进程（连同其子进程）被结束，不再占用CPU
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import verilog_optimizer_api as api
+
+def hang(pid_file):
+    """模拟卡住的优化：启动一个长时间运行的子进程（类似 yosys）后一直等待"""
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(600)"])
+    with open(pid_file, "w") as f:
+        f.write(f"{os.getpid()} {child.pid}")
+    time.sleep(600)
+
+def is_alive(pid):
+    """进程仍在运行（僵尸进程视为已结束）"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+async def run_timeout_test(pid_file):
+    """以很短的超时运行卡住的任务，检查超时异常和进程清理"""
+    start = time.time()
+    try:
+        await api.run_in_worker(hang, (pid_file,), timeout=3)
+    except Exception as e:
+        assert "超时" in str(e), e
+    else:
+        raise AssertionError("任务未超时")
+    print(f"✅ 超时异常在 {time.time() - start:.1f} 秒后抛出")
+
+    worker_pid, child_pid = map(int, open(pid_file).read().split())
+    deadline = time.time() + 5
+    while time.time() < deadline and (is_alive(worker_pid) or is_alive(child_pid)):
+        await asyncio.sleep(0.1)
+    assert not is_alive(worker_pid), f"任务进程 {worker_pid} 仍在运行"
+    assert not is_alive(child_pid), f"任务子进程 {child_pid} 仍在运行"
+    assert not api.running_workers, "任务进程未从运行列表中移除"
+    print(f"✅ 任务进程 {worker_pid} 及其子进程 {child_pid} 均已结束")
+
+def test_worker_timeout():
+    """测试超时任务的进程清理"""
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run_timeout_test(os.path.join(tmp, "pids")))
+
+if __name__ == "__main__":
+    test_worker_timeout()
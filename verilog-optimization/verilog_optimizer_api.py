@@ -5,22 +5,50 @@ Verilog优化API服务
 """
 
 import os
+import hashlib
+import signal
+import multiprocessing
 import tempfile
-import shutil
 import asyncio
+import json
+import re
 import time
+import uuid
+from collections import Counter, OrderedDict
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from enum import Enum
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Request, Query
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, ORJSONResponse, Response
 from pydantic import BaseModel, Field, field_validator
-import uvicorn
+
+# JSON编码：优先使用 orjson (C 实现)，大段 optimized_code 的序列化明显更快；未安装时回退到标准库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DefaultResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+def json_dumps(obj) -> str:
+    """序列化为JSON字符串（保留中文）"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False)
+
+def json_dumpb(obj) -> bytes:
+    """序列化为UTF-8编码的JSON字节串，可直接作为响应体"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
 
 # 导入我们的优化器
+import vop
 from vop import OptimizationStrategy
 
 # 配置日志
@@ -34,25 +62,173 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 全局变量存储临时任务
-active_jobs: Dict[str, Dict] = {}
+# 全局变量存储临时任务：按提交顺序保存，超出上限或过期的已结束任务会被淘汰
+active_jobs: Dict[str, Dict] = OrderedDict()
+MAX_JOBS = 512  # 内存中最多保留的任务数
+JOB_TTL = 3600  # 已结束任务自结束起的保留时间（秒）
+JOB_SWEEP_INTERVAL = 60  # 过期任务清理间隔（秒）
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'  # created_at/updated_at 等时间戳格式
+# 各状态的任务数，随状态变化增减维护；/health 直接读取，无需遍历 active_jobs
+status_counts: Counter = Counter()
+
+# 任务状态变更事件，供 /status 长轮询等待；每次变更后重新创建
+job_events: Dict[str, asyncio.Event] = {}
+MAX_STATUS_WAIT = 30  # 长轮询最长挂起时间（秒）
+FINAL_STATES = ('completed', 'failed')
+SSE_KEEPALIVE = 15  # SSE空闲时发送心跳注释的间隔（秒）
+MAX_UPLOAD_BYTES = 16 * 1024 * 1024  # 上传Verilog文件的大小上限
+UPLOAD_CHUNK_SIZE = 1 << 20  # 读取上传文件时每块的字节数
+
+# 优化结果落盘目录，/result/{job_id}/code 直接以文件响应返回（可走sendfile）
+# 代码和完整结果JSON只存在磁盘上，内存中的任务记录保持在KB级
+RESULT_DIR = Path(tempfile.gettempdir()) / "verilog_opt_results"
+RESULT_SUFFIXES = (".v", ".baseline.v", ".json")  # 优化代码、基线代码、序列化的完整结果
+
+def result_file(job_id: str, suffix: str = ".v") -> Path:
+    """任务结果文件的路径"""
+    return RESULT_DIR / f"{job_id}{suffix}"
+
+def read_result(job_id: str, suffix: str) -> Optional[str]:
+    """读取任务结果文件，不存在时返回None"""
+    path = result_file(job_id, suffix)
+    return path.read_text() if path.exists() else None
+
+def set_job_status(job_id: str, status: str):
+    """修改任务状态并同步维护 status_counts"""
+    job = active_jobs[job_id]
+    status_counts[job['status']] -= 1
+    status_counts[status] += 1
+    job['status'] = status
+    if status in FINAL_STATES:
+        # 单调时钟记录结束时刻，过期清理据此计算保留时间，不受系统时间调整影响
+        job['_finished_at'] = time.monotonic()
+
+def drop_job(job_id: str):
+    """移除任务记录及其结果文件，并唤醒等待该任务的请求"""
+    job = active_jobs.pop(job_id, None)
+    if job is not None:
+        status_counts[job['status']] -= 1
+    for suffix in RESULT_SUFFIXES:
+        result_file(job_id, suffix).unlink(missing_ok=True)
+    notify_job_update(job_id)
+
+def trim_jobs():
+    """任务数超出MAX_JOBS时，按提交顺序淘汰最早的已结束任务（运行中的任务不淘汰）"""
+    excess = len(active_jobs) - MAX_JOBS
+    if excess <= 0:
+        return
+    finished = [job_id for job_id, job in active_jobs.items() if job['status'] in FINAL_STATES]
+    for job_id in finished[:excess]:
+        drop_job(job_id)
+
+async def sweep_expired_jobs():
+    """后台定期清理结束超过JOB_TTL的任务（从任务结束而非创建时计时，耗时长的任务结束后同样保留JOB_TTL）"""
+    while True:
+        await asyncio.sleep(JOB_SWEEP_INTERVAL)
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in active_jobs.items()
+            if job['status'] in FINAL_STATES and now - job['_finished_at'] > JOB_TTL
+        ]
+        for job_id in expired:
+            drop_job(job_id)
+        if expired:
+            logger.info(f"清理过期任务 {len(expired)} 个")
+
+# analyze_verilog_code 一次扫描统计的关键字（整词匹配，制表符/换行分隔的声明也能计入）与逻辑运算符
+VERILOG_TOKEN_RE = re.compile(r'\b(?:wire|reg|input|output|assign|always|module|and|or|not)\b|[&|~]')
+# 非空行与注释行：按行首匹配（只跳过空格/制表符，不跨行）
+NON_EMPTY_LINE_RE = re.compile(r'^[ \t]*\S', re.M)
+COMMENT_LINE_RE = re.compile(r'^[ \t]*//', re.M)
+# 提交代码校验：不区分大小写查找module关键字，找到第一处即停止，无需复制整段源码做lower()
+MODULE_KEYWORD_RE = re.compile(r'\bmodule\b', re.IGNORECASE)
+
+# 优化任务进程：每个任务独占一个由 forkserver 派生的进程，超时即可整组结束，不会继续占用CPU
+# 预加载本服务模块（连同 vop、optuna），派生出的任务进程无需重新导入
+WORKER_CONTEXT = multiprocessing.get_context("forkserver")
+WORKER_CONTEXT.set_forkserver_preload(["__main__", "verilog_optimizer_api"])
+# 同时运行的优化进程数上限，超出的任务排队等待
+job_slots = asyncio.Semaphore(os.cpu_count() or 1)
+running_workers = set()
+
+# forkserver 以 __mp_main__ 的名义预加载启动脚本：在服务进程中提前完成 optuna 的延迟导入，任务进程fork后直接可用
+if __name__ == "__mp_main__":
+    vop.warmup()
+
+def warm_workers() -> None:
+    """启动 forkserver 并等其完成预加载：运行一个空任务进程，第一个优化任务不再付导入开销"""
+    proc = WORKER_CONTEXT.Process(target=os.getpid, daemon=True)
+    proc.start()
+    proc.join()
+
+def _worker_main(conn, func, args):
+    """任务进程入口：自成进程组（连同 yosys/abc 子进程可一并结束），结果经管道发回"""
+    os.setpgrp()
+    try:
+        conn.send(("ok", func(*args)))
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+def kill_worker(proc) -> None:
+    """结束任务进程所在的整个进程组；进程已退出时忽略"""
+    for kill in (lambda: os.killpg(proc.pid, signal.SIGKILL), proc.kill):
+        try:
+            kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+async def run_in_worker(func, args: tuple, timeout: float):
+    """在独立进程中执行 func(*args) 并返回结果；超时或出错时结束该进程组并抛出异常"""
+    receiver, sender = WORKER_CONTEXT.Pipe(duplex=False)
+    proc = WORKER_CONTEXT.Process(target=_worker_main, args=(sender, func, args), daemon=True)
+    await asyncio.to_thread(proc.start)
+    sender.close()
+    running_workers.add(proc)
+    reply = asyncio.ensure_future(asyncio.to_thread(receiver.recv))
+    try:
+        status, payload = await asyncio.wait_for(asyncio.shield(reply), timeout)
+    except asyncio.TimeoutError:
+        status, payload = "error", f"优化超时（{timeout}秒）"
+    except EOFError:
+        status, payload = "error", None
+    finally:
+        kill_worker(proc)
+        await asyncio.to_thread(proc.join)
+        await asyncio.gather(reply, return_exceptions=True)
+        receiver.close()
+        running_workers.discard(proc)
+    if status != "ok":
+        raise Exception(payload or f"优化进程异常退出（退出码 {proc.exitcode}）")
+    return payload
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     logger.info("🚀 Verilog优化API服务启动")
-    # 启动时的初始化
+    # 启动时的初始化：预热任务进程的 forkserver
+    await asyncio.to_thread(warm_workers)
+    sweeper = asyncio.create_task(sweep_expired_jobs())
     yield
-    # 关闭时的清理
+    sweeper.cancel()
+    # 关闭时的清理：结束仍在运行的优化进程，不等待其完成
+    for proc in list(running_workers):
+        kill_worker(proc)
     logger.info("🛑 Verilog优化API服务关闭")
 
 app = FastAPI(
     title="Verilog Logic Optimizer API",
     description="基于贝叶斯优化的Verilog RTL逻辑优化服务",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=DefaultResponse
 )
 
+# optimized_code 等大段Verilog文本压缩率很高；客户端声明 Accept-Encoding: gzip 时压缩返回
+# 注意：SSE推送在gzip下会被缓冲，/events 的客户端应声明 Accept-Encoding: identity
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # 请求模型
 class OptimizationLevel(str, Enum):
     """优化等级枚举"""
@@ -79,7 +255,7 @@ class OptimizationRequest(BaseModel):
     @classmethod
     def validate_verilog_code(cls, v: str) -> str:
         """验证Verilog代码"""
-        if 'module' not in v.lower():
+        if not MODULE_KEYWORD_RE.search(v):
             raise ValueError('Verilog代码必须包含module定义')
         return v
 
@@ -89,6 +265,8 @@ class OptimizationResponse(BaseModel):
     status: str = Field(..., description="任务状态: pending, running, completed, failed")
     message: str = Field(..., description="状态消息")
     optimized_code: Optional[str] = Field(None, description="优化后的Verilog代码")
+    code_url: Optional[str] = Field(None, description="优化后代码的下载地址（纯文本，不经过JSON编码）")
+    code_truncated: Optional[bool] = Field(None, description="代码是否为截断后的预览（请求带preview参数时）")
     baseline_code: Optional[str] = Field(None, description="基线代码（如果有）")
     optimization_stats: Optional[Dict[str, Any]] = Field(None, description="优化统计信息")
     optimization_summary: Optional[str] = Field(None, description="优化总结报告")
@@ -107,34 +285,95 @@ class JobStatus(BaseModel):
 # 工具函数
 def generate_job_id() -> str:
     """生成任务ID"""
-    import uuid
-    return f"job_{int(time.time())}_{str(uuid.uuid4())[:8]}"
+    return f"job_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+
+_ts_cache = [0, ""]  # [秒级时间戳, 格式化结果]
+
+def now_str() -> str:
+    """当前时间的格式化字符串，同一秒内复用上次的结果，每秒最多调用一次strftime"""
+    t = int(time.time())
+    if t != _ts_cache[0]:
+        _ts_cache[0] = t
+        _ts_cache[1] = time.strftime(TIME_FORMAT, time.localtime(t))
+    return _ts_cache[1]
+
+def refresh_etag(job: Dict):
+    """根据状态、消息和更新时间重新计算任务的ETag，供 /status 的 If-None-Match 比对"""
+    job['_etag'] = f'W/"{hash((job["status"], job["message"], job["updated_at"])) & 0xFFFFFFFFFFFFFFFF:x}"'
+
+def notify_job_update(job_id: str):
+    """任务状态变化后刷新ETag，并唤醒所有等待该任务的长轮询请求"""
+    job = active_jobs.get(job_id)
+    if job is not None:
+        refresh_etag(job)
+    event = job_events.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+def head_lines(text: Optional[str], max_lines: int) -> Tuple[Optional[str], bool]:
+    """截取文本的前max_lines行，返回(截取结果, 是否被截断)"""
+    if text is None:
+        return None, False
+    end = -1
+    for _ in range(max_lines):
+        end = text.find('\n', end + 1)
+        if end == -1:
+            return text, False
+    if end == len(text) - 1:  # 恰好以最后一行结尾
+        return text, False
+    return text[:end], True
+
+def save_result(job_id: str, job: Dict, optimized_code: Optional[str] = None, baseline_code: Optional[str] = None):
+    """任务结束时把代码和一次性序列化的完整结果（字段与OptimizationResponse一致）写入磁盘
+    
+    job 为任务的最终记录；之后的 /result 查询直接返回这份JSON文件，不再构造模型和编码JSON
+    """
+    RESULT_DIR.mkdir(parents=True, exist_ok=True)
+    if optimized_code is not None:
+        result_file(job_id).write_text(optimized_code)
+    if baseline_code is not None:
+        result_file(job_id, ".baseline.v").write_text(baseline_code)
+    
+    result_file(job_id, ".json").write_bytes(json_dumpb({
+        "job_id": job_id,
+        "status": job['status'],
+        "message": job['message'],
+        "optimized_code": optimized_code,
+        "code_url": job.get('code_url'),
+        "code_truncated": None,
+        "baseline_code": baseline_code,
+        "optimization_stats": job.get('optimization_stats'),
+        "optimization_summary": job.get('optimization_summary'),
+        "execution_time": job.get('execution_time'),
+        "error_details": job.get('error_details')
+    }))
 
 def analyze_verilog_code(verilog_code: str) -> Dict[str, Any]:
     """分析Verilog代码的统计信息"""
-    lines = verilog_code.splitlines()
-    
-    # 基础统计
-    total_lines = len(lines)
-    non_empty_lines = len([line for line in lines if line.strip()])
-    comment_lines = len([line for line in lines if line.strip().startswith('//')])
+    # 基础统计：直接在原始字符串上计数，不切分出行列表
+    total_lines = verilog_code.count('\n') + (0 if verilog_code.endswith('\n') else 1) if verilog_code else 0
+    non_empty_lines = len(NON_EMPTY_LINE_RE.findall(verilog_code))
+    comment_lines = len(COMMENT_LINE_RE.findall(verilog_code))
     code_lines = non_empty_lines - comment_lines
     
+    # 关键字与运算符：一次正则扫描
+    tokens = Counter(m.group() for m in VERILOG_TOKEN_RE.finditer(verilog_code))
+    
     # 信号统计
-    wire_count = verilog_code.count('wire ')
-    reg_count = verilog_code.count('reg ')
-    input_count = verilog_code.count('input ')
-    output_count = verilog_code.count('output ')
+    wire_count = tokens['wire']
+    reg_count = tokens['reg']
+    input_count = tokens['input']
+    output_count = tokens['output']
     
     # 逻辑门统计
-    and_gates = verilog_code.count(' and ') + verilog_code.count('&')
-    or_gates = verilog_code.count(' or ') + verilog_code.count('|')  
-    not_gates = verilog_code.count(' not ') + verilog_code.count('~')
-    assign_count = verilog_code.count('assign ')
+    and_gates = tokens['and'] + tokens['&']
+    or_gates = tokens['or'] + tokens['|']
+    not_gates = tokens['not'] + tokens['~']
+    assign_count = tokens['assign']
     
     # 模块信息
-    module_count = verilog_code.count('module ')
-    always_blocks = verilog_code.count('always ')
+    module_count = tokens['module']
+    always_blocks = tokens['always']
     
     return {
         'total_lines': total_lines,
@@ -152,19 +391,82 @@ def analyze_verilog_code(verilog_code: str) -> Dict[str, Any]:
         'always_blocks': always_blocks
     }
 
-def generate_optimization_summary(
+# 优化总结报告用到的固定文本和表格格式，模块加载时构建一次
+STRATEGY_GOALS = {
+    'minimal': '最小化修改，保持原始RTL结构，适用于需要保持代码可读性的场景',
+    'readable': '清理和优化代码结构，去除冗余信号，提高可读性，适合日常开发',
+    'balanced': '在面积和可读性之间取得平衡，适合生产环境',
+    'yosys_only': '使用纯Yosys优化，避免门级分解，保持高层次结构',
+    'aig': '激进的面积优化，转换为最小的与非门结构，适合面积敏感应用'
+}
+
+STRATEGY_SPECIFIC_IMPROVEMENTS = {
+    'minimal': ("• 保持了原始RTL结构的完整性", "• 最小化了对原代码的修改"),
+    'readable': ("• 提高了代码的可读性和维护性", "• 清理了冗余的中间信号"),
+    'balanced': ("• 在面积和可读性之间取得了良好平衡",),
+    'yosys_only': ("• 避免了门级分解，保持了高层次抽象",),
+    'aig': ("• 实现了最大程度的面积优化", "• 转换为最小的逻辑门表示")
+}
+
+# (显示名称, analyze_verilog_code 统计字段)
+SUMMARY_METRICS = (
+    ('总行数', 'total_lines'),
+    ('代码行数', 'code_lines'),
+    ('wire信号', 'wire_count'),
+    ('reg信号', 'reg_count'),
+    ('assign语句', 'assign_count'),
+    ('always块', 'always_blocks')
+)
+
+SUMMARY_ROW = "{metric:<15} {orig:<10} {opt:<10} {change:<10} {improvement:<8}"
+SUMMARY_TABLE_HEADER = SUMMARY_ROW.format(metric='指标', orig='优化前', opt='优化后', change='变化', improvement='改进')
+
+def build_optimization_report(
     original_code: str,
     optimized_code: str,
     strategy: str,
     execution_time: float,
     n_trials: int
-) -> str:
-    """生成优化总结报告"""
+) -> Tuple[Dict[str, Any], str]:
+    """生成优化统计信息和优化总结报告
     
-    # 分析原始代码和优化后代码
+    两份代码各分析一次，各项减少量也只计算一次，统计信息和总结都基于同一份结果
+    """
     orig_stats = analyze_verilog_code(original_code)
     opt_stats = analyze_verilog_code(optimized_code)
     
+    line_reduction = orig_stats['total_lines'] - opt_stats['total_lines']
+    wire_reduction = orig_stats['wire_count'] - opt_stats['wire_count']
+    
+    optimization_stats = {
+        # 基本对比
+        "original_stats": orig_stats,
+        "optimized_stats": opt_stats,
+        
+        # 关键指标
+        "line_reduction": line_reduction,
+        "line_reduction_percent": round(line_reduction / orig_stats['total_lines'] * 100, 2) if orig_stats['total_lines'] > 0 else 0,
+        "wire_reduction": wire_reduction,
+        "wire_reduction_percent": round(wire_reduction / orig_stats['wire_count'] * 100, 2) if orig_stats['wire_count'] > 0 else 0,
+        
+        # 执行信息
+        "strategy_used": strategy,
+        "trials_completed": n_trials,
+        "execution_time": execution_time
+    }
+    
+    return optimization_stats, generate_optimization_summary(optimization_stats)
+
+def generate_optimization_summary(optimization_stats: Dict[str, Any]) -> str:
+    """根据 build_optimization_report 算出的统计信息生成优化总结报告"""
+    orig_stats = optimization_stats['original_stats']
+    opt_stats = optimization_stats['optimized_stats']
+    line_reduction = optimization_stats['line_reduction']
+    wire_reduction = optimization_stats['wire_reduction']
+    strategy = optimization_stats['strategy_used']
+    execution_time = optimization_stats['execution_time']
+    n_trials = optimization_stats['trials_completed']
+    
     # 计算改进百分比
     def calc_improvement(original, optimized):
         if original == 0:
@@ -177,15 +479,7 @@ def generate_optimization_summary(
     summary_lines.append("=" * 40)
     
     # 策略说明
-    strategy_goals = {
-        'minimal': '最小化修改，保持原始RTL结构，适用于需要保持代码可读性的场景',
-        'readable': '清理和优化代码结构，去除冗余信号，提高可读性，适合日常开发',
-        'balanced': '在面积和可读性之间取得平衡，适合生产环境',
-        'yosys_only': '使用纯Yosys优化，避免门级分解，保持高层次结构',
-        'aig': '激进的面积优化，转换为最小的与非门结构，适合面积敏感应用'
-    }
-    
-    goal = strategy_goals.get(strategy, '执行指定优化策略')
+    goal = STRATEGY_GOALS.get(strategy, '执行指定优化策略')
     summary_lines.append(f"📋 **优化策略**: {strategy.upper()}")
     summary_lines.append(f"🎯 **优化目标**: {goal}")
     summary_lines.append(f"⚡ **执行时间**: {execution_time:.2f}秒 ({n_trials}次试验)")
@@ -194,24 +488,21 @@ def generate_optimization_summary(
     # 代码结构对比
     summary_lines.append("📊 **代码结构对比**")
     summary_lines.append("```")
-    summary_lines.append(f"{'指标':<15} {'优化前':<10} {'优化后':<10} {'变化':<10} {'改进':<8}")
+    summary_lines.append(SUMMARY_TABLE_HEADER)
     summary_lines.append("-" * 55)
     
-    metrics = [
-        ('总行数', orig_stats['total_lines'], opt_stats['total_lines']),
-        ('代码行数', orig_stats['code_lines'], opt_stats['code_lines']),
-        ('wire信号', orig_stats['wire_count'], opt_stats['wire_count']),
-        ('reg信号', orig_stats['reg_count'], opt_stats['reg_count']),
-        ('assign语句', orig_stats['assign_count'], opt_stats['assign_count']),
-        ('always块', orig_stats['always_blocks'], opt_stats['always_blocks'])
-    ]
-    
-    for metric, orig, opt in metrics:
+    for metric, key in SUMMARY_METRICS:
+        orig = orig_stats[key]
+        opt = opt_stats[key]
         change = orig - opt
         improvement = calc_improvement(orig, opt)
-        change_str = f"{change:+d}" if change != 0 else "0"
-        improvement_str = f"{improvement:+.1f}%" if improvement != 0 else "0%"
-        summary_lines.append(f"{metric:<15} {orig:<10} {opt:<10} {change_str:<10} {improvement_str:<8}")
+        summary_lines.append(SUMMARY_ROW.format(
+            metric=metric,
+            orig=orig,
+            opt=opt,
+            change=f"{change:+d}" if change != 0 else "0",
+            improvement=f"{improvement:+.1f}%" if improvement != 0 else "0%"
+        ))
     
     summary_lines.append("```")
     summary_lines.append("")
@@ -220,11 +511,9 @@ def generate_optimization_summary(
     summary_lines.append("✨ **主要改进**")
     improvements = []
     
-    line_reduction = orig_stats['total_lines'] - opt_stats['total_lines']
     if line_reduction > 0:
         improvements.append(f"• 减少了 {line_reduction} 行代码 ({calc_improvement(orig_stats['total_lines'], opt_stats['total_lines'])}%)")
     
-    wire_reduction = orig_stats['wire_count'] - opt_stats['wire_count']
     if wire_reduction > 0:
         improvements.append(f"• 消除了 {wire_reduction} 个冗余信号线")
     
@@ -235,25 +524,12 @@ def generate_optimization_summary(
         improvements.append(f"• 展开了复杂逻辑，增加了 {abs(assign_change)} 个assign语句")
     
     # 根据策略添加特定改进说明
-    if strategy == 'minimal':
-        improvements.append("• 保持了原始RTL结构的完整性")
-        improvements.append("• 最小化了对原代码的修改")
-    elif strategy == 'readable':
-        improvements.append("• 提高了代码的可读性和维护性")
-        improvements.append("• 清理了冗余的中间信号")
-    elif strategy == 'balanced':
-        improvements.append("• 在面积和可读性之间取得了良好平衡")
-    elif strategy == 'yosys_only':
-        improvements.append("• 避免了门级分解，保持了高层次抽象")
-    elif strategy == 'aig':
-        improvements.append("• 实现了最大程度的面积优化")
-        improvements.append("• 转换为最小的逻辑门表示")
+    improvements.extend(STRATEGY_SPECIFIC_IMPROVEMENTS.get(strategy, ()))
     
     if not improvements:
         improvements.append("• 代码结构已经比较优化，无需大幅修改")
     
-    for improvement in improvements:
-        summary_lines.append(improvement)
+    summary_lines.extend(improvements)
     
     summary_lines.append("")
     
@@ -289,144 +565,87 @@ async def run_optimization_async(
     
     try:
         # 更新任务状态
-        active_jobs[job_id]['status'] = 'running'
+        set_job_status(job_id, 'running')
         active_jobs[job_id]['message'] = '开始优化...'
-        active_jobs[job_id]['updated_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        active_jobs[job_id]['updated_at'] = now_str()
+        notify_job_update(job_id)
         
         logger.info(f"开始优化任务 {job_id}, 策略: {optimization_level}, 试验次数: {n_trials}")
         
-        # 创建临时目录和文件
-        with tempfile.TemporaryDirectory(prefix=f"verilog_opt_{job_id}_") as temp_dir:
-            temp_dir_path = Path(temp_dir)
-            input_file = temp_dir_path / "input.v"
-            output_dir = temp_dir_path / "output"
+        # 执行优化
+        active_jobs[job_id]['message'] = f'执行{optimization_level.value}优化中...'
+        notify_job_update(job_id)
+        
+        try:
+            # 在独立的任务进程中直接调用优化器，结果以字符串返回，无需经过输入/输出文件
+            async with job_slots:
+                result = await run_in_worker(
+                    vop.run_optimization,
+                    (
+                        verilog_code,
+                        optimization_level.value,
+                        n_trials,
+                        seq_length,
+                        delay_weight,
+                        top_module
+                    ),
+                    timeout
+                )
             
-            # 写入Verilog文件
-            input_file.write_text(verilog_code)
+            baseline_code = result["baseline"]
+            optimized_code = result["optimized"] or baseline_code  # 使用基线作为备用
             
-            # 执行优化
-            active_jobs[job_id]['message'] = f'执行{optimization_level.value}优化中...'
+            if not optimized_code:
+                raise Exception("没有找到优化输出文件")
+            
+            # 分析优化效果
+            execution_time = time.time() - start_time
+            
+            # 生成统计信息和优化总结；统计、总结和落盘都在线程中执行，大设计也不会阻塞事件循环上的其他请求
+            optimization_stats, optimization_summary = await asyncio.to_thread(
+                build_optimization_report,
+                verilog_code,
+                optimized_code,
+                optimization_level.value,
+                execution_time,
+                n_trials
+            )
+            
+            # 代码只写入磁盘，大设计的客户端可直接下载文件而不必解析JSON；结果文件写完后再把任务标记为完成
+            final = {
+                'message': '优化完成',
+                'code_url': f"/result/{job_id}/code",
+                'optimization_stats': optimization_stats,
+                'optimization_summary': optimization_summary,
+                'execution_time': execution_time,
+                'updated_at': now_str()
+            }
+            await asyncio.to_thread(
+                save_result, job_id, {**active_jobs[job_id], **final, 'status': 'completed'}, optimized_code, baseline_code
+            )
+            set_job_status(job_id, 'completed')
+            active_jobs[job_id].update(final)
+            notify_job_update(job_id)
+            
+            logger.info(f"任务 {job_id} 完成，用时 {execution_time:.2f} 秒")
+            
+        except Exception as e:
+            raise Exception(f"优化执行错误: {str(e)}")
             
-            try:
-                # 这里需要在子进程中运行，因为原函数是同步的
-                import subprocess
-                import json
-                
-                # 创建优化命令
-                cmd = [
-                    "python", "vop.py",
-                    str(input_file),
-                    "--strategy", optimization_level.value,
-                    "--n-trials", str(n_trials),
-                    "--seq-len", str(seq_length),
-                    "--delay-w", str(delay_weight),
-                    "--out-dir", str(output_dir)
-                ]
-                
-                if top_module:
-                    cmd.extend(["--top", top_module])
-                
-                # 运行优化
-                result = subprocess.run(
-                    cmd, 
-                    capture_output=True, 
-                    text=True, 
-                    timeout=timeout,
-                    cwd=Path(__file__).parent
-                )
-                
-                if result.returncode != 0:
-                    raise Exception(f"优化失败: {result.stderr}")
-                
-                # 读取优化结果
-                optimized_code = None
-                baseline_code = None
-                
-                # 查找输出文件
-                possible_output_files = [
-                    output_dir / "best_opt.v",
-                    output_dir / "baseline_readable.v",
-                    output_dir / "baseline_minimal.v"
-                ]
-                
-                for output_file in possible_output_files:
-                    if output_file.exists():
-                        if "best_opt" in output_file.name:
-                            optimized_code = output_file.read_text()
-                        elif "baseline" in output_file.name:
-                            baseline_code = output_file.read_text()
-                
-                if not optimized_code and baseline_code:
-                    optimized_code = baseline_code  # 使用基线作为备用
-                
-                if not optimized_code:
-                    raise Exception("没有找到优化输出文件")
-                
-                # 分析优化效果
-                execution_time = time.time() - start_time
-                
-                # 使用新的详细分析功能
-                orig_stats = analyze_verilog_code(verilog_code)
-                opt_stats = analyze_verilog_code(optimized_code)
-                
-                # 生成增强的统计信息
-                optimization_stats = {
-                    # 基本对比
-                    "original_stats": orig_stats,
-                    "optimized_stats": opt_stats,
-                    
-                    # 关键指标
-                    "line_reduction": orig_stats['total_lines'] - opt_stats['total_lines'],
-                    "line_reduction_percent": round(((orig_stats['total_lines'] - opt_stats['total_lines']) / orig_stats['total_lines'] * 100), 2) if orig_stats['total_lines'] > 0 else 0,
-                    "wire_reduction": orig_stats['wire_count'] - opt_stats['wire_count'],
-                    "wire_reduction_percent": round(((orig_stats['wire_count'] - opt_stats['wire_count']) / orig_stats['wire_count'] * 100), 2) if orig_stats['wire_count'] > 0 else 0,
-                    
-                    # 执行信息
-                    "strategy_used": optimization_level.value,
-                    "trials_completed": n_trials,
-                    "execution_time": execution_time
-                }
-                
-                # 生成优化总结
-                optimization_summary = generate_optimization_summary(
-                    verilog_code,
-                    optimized_code,
-                    optimization_level.value,
-                    execution_time,
-                    n_trials
-                )
-                
-                # 更新任务状态为完成
-                active_jobs[job_id].update({
-                    'status': 'completed',
-                    'message': '优化完成',
-                    'optimized_code': optimized_code,
-                    'baseline_code': baseline_code,
-                    'optimization_stats': optimization_stats,
-                    'optimization_summary': optimization_summary,
-                    'execution_time': execution_time,
-                    'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
-                })
-                
-                logger.info(f"任务 {job_id} 完成，用时 {execution_time:.2f} 秒")
-                
-            except subprocess.TimeoutExpired:
-                raise Exception(f"优化超时（{timeout}秒）")
-            except Exception as e:
-                raise Exception(f"优化执行错误: {str(e)}")
-                
     except Exception as e:
         error_msg = str(e)
         logger.error(f"任务 {job_id} 失败: {error_msg}")
         
         # 更新任务状态为失败
+        set_job_status(job_id, 'failed')
         active_jobs[job_id].update({
-            'status': 'failed',
             'message': '优化失败',
             'error_details': error_msg,
             'execution_time': time.time() - start_time,
-            'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+            'updated_at': now_str()
         })
+        save_result(job_id, active_jobs[job_id])
+        notify_job_update(job_id)
 
 # API端点
 @app.get("/")
@@ -438,21 +657,25 @@ async def root():
         "description": "基于贝叶斯优化的Verilog RTL逻辑优化服务",
         "endpoints": {
             "optimize": "POST /optimize - 提交优化任务",
-            "status": "GET /status/{job_id} - 查询任务状态",
-            "result": "GET /result/{job_id} - 获取优化结果",
-            "jobs": "GET /jobs - 查看所有任务",
+            "status": "GET /status/{job_id}?wait=N - 查询任务状态（wait>0时长轮询等待状态变化）",
+            "events": "GET /events/{job_id} - 以SSE推送任务状态变化",
+            "result": "GET /result/{job_id}?preview=N - 获取优化结果（preview>0时代码只返回前N行）",
+            "code": "GET /result/{job_id}/code - 以文件形式下载完整优化代码",
+            "jobs": "GET /jobs?status=S&limit=N - 查看任务（可按状态过滤、限制条数）",
             "health": "GET /health - 健康检查"
         }
     }
 
-@app.get("/health")
+@app.get("/health", response_class=DefaultResponse)
 async def health_check():
     """健康检查"""
-    return {
+    return DefaultResponse({
         "status": "healthy",
-        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
-        "active_jobs": len(active_jobs)
-    }
+        "timestamp": now_str(),
+        "active_jobs": len(active_jobs),
+        "running": status_counts['running'],
+        "queued": status_counts['pending']
+    })
 
 @app.post("/optimize", response_model=Dict[str, str])
 async def optimize_verilog(
@@ -468,10 +691,14 @@ async def optimize_verilog(
         'job_id': job_id,
         'status': 'pending',
         'message': '任务已提交，等待执行',
-        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
-        'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
-        'request_params': request.dict()
+        'created_at': now_str(),
+        'updated_at': now_str(),
+        'request_params': request.model_dump(exclude={'verilog_code'}),  # 源码不随任务记录常驻内存
+        'code_sha': hashlib.sha256(request.verilog_code.encode()).hexdigest()  # 仅保留源码摘要便于追溯
     }
+    status_counts['pending'] += 1
+    refresh_etag(active_jobs[job_id])
+    trim_jobs()
     
     # 添加后台任务
     background_tasks.add_task(
@@ -495,46 +722,143 @@ async def optimize_verilog(
         "result_url": f"/result/{job_id}"
     }
 
-@app.get("/status/{job_id}", response_model=JobStatus)
-async def get_job_status(job_id: str):
-    """查询任务状态"""
+@app.get("/status/{job_id}", response_class=DefaultResponse)
+async def get_job_status(job_id: str, request: Request, wait: float = 0):
+    """查询任务状态
+    
+    wait>0 时为长轮询：任务未结束则挂起请求，直到状态变化或等待超时（最长30秒）后返回当前状态
+    请求带 If-None-Match 且状态未变化时返回304空响应；ETag已过期（客户端错过了变化）时不再等待，直接返回
+    """
     if job_id not in active_jobs:
         raise HTTPException(status_code=404, detail="任务不存在")
     
+    if_none_match = request.headers.get('if-none-match')
+    wait = min(wait, MAX_STATUS_WAIT)
+    if (wait > 0 and active_jobs[job_id]['status'] not in FINAL_STATES
+            and if_none_match in (None, active_jobs[job_id]['_etag'])):
+        event = job_events.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass  # 超时仍返回当前状态，由客户端重新发起
+        
+        if job_id not in active_jobs:  # 等待期间任务被删除
+            raise HTTPException(status_code=404, detail="任务不存在")
+    
     job = active_jobs[job_id]
-    return JobStatus(
-        job_id=job_id,
-        status=job['status'],
-        message=job['message'],
-        created_at=job['created_at'],
-        updated_at=job['updated_at']
+    etag = job['_etag']
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # 轮询热点路径：直接构造字典返回，跳过Pydantic模型校验和jsonable_encoder（字段与JobStatus一致）
+    return DefaultResponse({
+        "job_id": job_id,
+        "status": job['status'],
+        "message": job['message'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at']
+    }, headers={"ETag": etag})
+
+@app.get("/events/{job_id}")
+async def stream_job_events(job_id: str):
+    """以Server-Sent Events推送任务状态变化，任务结束后关闭流"""
+    if job_id not in active_jobs:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    async def event_stream():
+        while True:
+            job = active_jobs.get(job_id)
+            if job is None:  # 任务被删除
+                return
+            
+            # 先登记事件再推送，推送期间发生的状态变化不会丢失
+            event = job_events.setdefault(job_id, asyncio.Event())
+            status = {
+                "job_id": job_id,
+                "status": job['status'],
+                "message": job['message'],
+                "created_at": job['created_at'],
+                "updated_at": job['updated_at']
+            }
+            yield f"event: status\ndata: {json_dumps(status)}\n\n"
+            
+            if job['status'] in FINAL_STATES:
+                return
+            
+            while True:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=SSE_KEEPALIVE)
+                    break
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"  # 心跳，防止空闲连接被中间设备断开
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
     )
 
 @app.get("/result/{job_id}", response_model=OptimizationResponse)
-async def get_optimization_result(job_id: str):
-    """获取优化结果"""
+async def get_optimization_result(job_id: str, preview: int = 0):
+    """获取优化结果
+    
+    preview>0 时只返回代码的前preview行，完整代码可通过 /result/{job_id}/code 下载
+    """
     if job_id not in active_jobs:
         raise HTTPException(status_code=404, detail="任务不存在")
     
     job = active_jobs[job_id]
+    # 已结束的任务直接返回预先序列化的结果文件，重复查询不再构造模型和编码JSON
+    serialized = result_file(job_id, ".json")
+    if preview <= 0 and serialized.exists():
+        return FileResponse(serialized, media_type='application/json')
+    
+    optimized_code = read_result(job_id, ".v")
+    baseline_code = read_result(job_id, ".baseline.v")
+    code_truncated = None
+    if preview > 0:
+        optimized_code, code_truncated = head_lines(optimized_code, preview)
+        baseline_code, _ = head_lines(baseline_code, preview)
     
     return OptimizationResponse(
         job_id=job_id,
         status=job['status'],
         message=job['message'],
-        optimized_code=job.get('optimized_code'),
-        baseline_code=job.get('baseline_code'),
+        optimized_code=optimized_code,
+        code_url=job.get('code_url'),
+        code_truncated=code_truncated,
+        baseline_code=baseline_code,
         optimization_stats=job.get('optimization_stats'),
         optimization_summary=job.get('optimization_summary'),
         execution_time=job.get('execution_time'),
         error_details=job.get('error_details')
     )
 
-@app.get("/jobs")
-async def list_jobs():
-    """列出所有任务"""
-    return {
+@app.get("/result/{job_id}/code")
+async def download_optimized_code(job_id: str):
+    """以文件响应下载完整的优化后代码，原始字节直接发送（可走sendfile），不经过JSON编码"""
+    if job_id not in active_jobs:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    path = result_file(job_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="任务尚无优化结果")
+    
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{job_id}_opt.v")
+
+@app.get("/jobs", response_class=DefaultResponse)
+async def list_jobs(status: Optional[str] = None, limit: Optional[int] = Query(None, ge=0)):
+    """列出任务
+    
+    status 只列出该状态的任务，limit 限制返回条数（按提交顺序），取够即停止遍历
+    """
+    jobs = (
+        (job_id, job) for job_id, job in active_jobs.items()
+        if status is None or job['status'] == status
+    )
+    return DefaultResponse({
         "total_jobs": len(active_jobs),
+        "status_counts": {k: v for k, v in status_counts.items() if v},
         "jobs": [
             {
                 "job_id": job_id,
@@ -542,9 +866,9 @@ async def list_jobs():
                 "created_at": job['created_at'],
                 "updated_at": job['updated_at']
             }
-            for job_id, job in active_jobs.items()
+            for job_id, job in islice(jobs, limit)
         ]
-    }
+    })
 
 @app.delete("/job/{job_id}")
 async def delete_job(job_id: str):
@@ -552,7 +876,7 @@ async def delete_job(job_id: str):
     if job_id not in active_jobs:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    del active_jobs[job_id]
+    drop_job(job_id)
     return {"message": f"任务 {job_id} 已删除"}
 
 @app.post("/optimize/file")
@@ -569,9 +893,14 @@ async def optimize_verilog_file(
     if not file.filename.endswith(('.v', '.sv', '.verilog')):
         raise HTTPException(status_code=400, detail="只支持.v, .sv, .verilog文件")
     
-    # 读取文件内容
+    # 分块读取文件内容：边读边检查大小，超限立即拒绝；数据只累积在一个缓冲区中，最后解码一次
+    content = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        content += chunk
+        if len(content) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"文件过大，最大支持{MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+    
     try:
-        content = await file.read()
         verilog_code = content.decode('utf-8')
     except UnicodeDecodeError:
         raise HTTPException(status_code=400, detail="文件编码错误，请使用UTF-8编码")
@@ -588,6 +917,8 @@ async def optimize_verilog_file(
 
 if __name__ == "__main__":
     import argparse
+    import importlib.util
+    import uvicorn
     
     parser = argparse.ArgumentParser(description="Verilog优化API服务")
     parser.add_argument("--host", default="0.0.0.0", help="服务地址")
@@ -601,10 +932,18 @@ if __name__ == "__main__":
     print(f"📍 地址: http://{args.host}:{args.port}")
     print(f"📚 文档: http://{args.host}:{args.port}/docs")
     
+    # uvloop/httptools（随 uvicorn[standard] 安装）可用时直接指定，否则（如 Windows 上没有 uvloop）交给 uvicorn 自动选择
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "auto"
+    http = "httptools" if importlib.util.find_spec("httptools") else "auto"
+    
     uvicorn.run(
         "verilog_optimizer_api:app",
         host=args.host,
         port=args.port,
         workers=args.workers,
-        reload=args.reload
+        reload=args.reload,
+        loop=loop,
+        http=http,
+        log_level="warning",
+        access_log=False
     ) 
\ No newline at end of file
@@ -25,13 +25,24 @@ python bo_logic_opt.py my.v --top my_top -n 100 -l 8 --strategy readable
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
+import os
+import queue
 import re
+import shutil
+import string
 import subprocess
+import sys
 import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 from enum import Enum
 
+import numpy as np
 import optuna
 
 class OptimizationStrategy(Enum):
@@ -63,6 +74,17 @@ PASS_CANDIDATES = [
     "dc2", "dch", "resyn2",
 ]
 
+# Same kind of passes run through ABC's GIA manager (&-commands), which is much faster
+# than the legacy AIG manager on large netlists; only used by the AIG strategy.
+PASS_CANDIDATES_GIA = [
+    "&get -n; &fraig -x; &put",
+    "&get -n; &syn2; &put",
+    "&get -n; &dc2; &put",
+]
+
+# ABC commands among the candidates; mixed into a Yosys flow they run inside Yosys's abc pass
+ABC_PASSES = frozenset(p for p in PASS_CANDIDATES if p)
+
 # Enhanced pass candidates for readable optimization
 YOSYS_PASS_CANDIDATES = [
     "",  # NOP placeholder
@@ -87,111 +109,405 @@ MINIMAL_PASS_CANDIDATES = [
 
 DELAY_WEIGHT_DEFAULT = 0.1
 ABC_TIMEOUT = 60  # sec per call
+SEQ_CATEGORICAL_MAX = 4096  # larger sequence spaces are searched as length + per-slot passes
+STUDY_DB = "study.db"  # persistent Optuna study, kept in the output directory
+STUDY_DB_TIMEOUT = 30  # sec to wait for a locked study DB
+EARLY_STOP_WINDOW = 20  # --early-stop: look at this many recent trials ...
+EARLY_STOP_DISTINCT = 3  # ... and stop once they contain at most this many distinct commands
+SURROGATE_MIN_OBS = 30  # --surrogate: real evaluations before the first fit
+SURROGATE_REFIT = 20  # refit after this many more
+SURROGATE_MARGIN = 1.3  # skip sequences predicted worse than best * margin
+# Scratch space for run_optimization and trial files: tmpfs when available, so they never touch disk.
+SCRATCH_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
 
 # ───────────────────────── Shell helper ─────────────────────────────────
 
-def sh(cmd: str, timeout: int = ABC_TIMEOUT) -> str:
-    """Run *cmd* in shell, return stdout, raise on error (stdout attached)."""
-    proc = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE,
+def sh(argv: List[str], timeout: int = ABC_TIMEOUT) -> str:
+    """Run *argv* (no shell), return stdout, raise on error (stdout attached)."""
+    proc = subprocess.run(argv, stdout=subprocess.PIPE,
                           stderr=subprocess.STDOUT, timeout=timeout, text=True)
     if proc.returncode:
-        raise RuntimeError(f"Command failed: {cmd}\n---\n{proc.stdout}")
+        raise RuntimeError(f"Command failed: {' '.join(argv)}\n---\n{proc.stdout}")
     return proc.stdout
 
+# ───────────────────────── Persistent Yosys session ────────────────────────
+
+class YosysSession:
+    """Long-lived interactive Yosys process holding the parsed RTL.
+
+    The design is read, elaborated and saved once; each :meth:`run` restores that
+    snapshot and replays only the trial's commands, so Optuna trials skip process
+    start-up and Verilog parsing. A sentinel line marks the end of each run.
+    """
+    SENTINEL = "___YDONE___"
+
+    def __init__(self, verilog: str, top: Optional[str] = None, timeout: int = ABC_TIMEOUT):
+        if not Path(verilog).exists():
+            raise FileNotFoundError(verilog)
+        self.setup = f"{frontend_script(verilog, top)}; design -save base"
+        self.timeout = timeout
+        self.proc = None
+        self._start()
+
+    def _start(self):
+        self.proc = subprocess.Popen(["yosys", "-q"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, text=True, bufsize=1)
+        self._send(self.setup)
+
+    def _send(self, script: str) -> str:
+        """Send *script*, return its output; raise if Yosys reports an error or dies."""
+        # A hung command is killed by the timer; EOF on stdout then ends the read loop.
+        timer = threading.Timer(self.timeout, self.proc.kill)
+        timer.start()
+        try:
+            self.proc.stdin.write(f"{script}\nlog -stdout {self.SENTINEL}\n")
+            self.proc.stdin.flush()
+            out = []
+            for line in self.proc.stdout:
+                # The interactive prompt may precede the sentinel on the same line.
+                if line.rstrip("\n").rpartition("> ")[2] == self.SENTINEL:
+                    break
+                out.append(line)
+            else:
+                self._reap()
+                raise RuntimeError(f"Yosys session exited\n---\n{''.join(out)}")
+        except OSError as e:
+            self._reap()
+            raise RuntimeError(f"Yosys session exited: {e}")
+        finally:
+            timer.cancel()
+        output = "".join(out)
+        if "ERROR:" in output:
+            raise RuntimeError(f"Yosys command failed: {script}\n---\n{output}")
+        return output
+
+    def _reap(self):
+        """Make sure a broken session is dead so the next run() restarts it."""
+        self.proc.kill()
+        self.proc.wait()
+
+    def run(self, script: str, fresh: bool = True) -> str:
+        """Run *script* on a fresh copy of the elaborated design.
+
+        With ``fresh=False`` the script continues on the design left by the previous run,
+        e.g. to apply a trial's passes one step at a time.
+        """
+        if self.proc.poll() is not None:  # killed by a timeout: start over
+            self._start()
+        return self._send(f"design -load base; {script}" if fresh else script)
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 # ───────────────────────── Different synthesis strategies ──────────────────
 
+# Plain Verilog identifier; anything else given as top would be spliced into the Yosys script
+TOP_NAME_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_$]*")
+
+def top_option(top: Optional[str]) -> str:
+    """``-top <name>`` for Yosys commands ("" without a top); rejects non-identifier names"""
+    if not top:
+        return ""
+    if not TOP_NAME_RE.fullmatch(top):
+        raise ValueError(f"Invalid top module name: {top!r}")
+    return f"-top {top}"
+
+# Fixed one-shot flows, built once and filled in per call
+AIG_SCRIPT = string.Template(
+    "read_verilog $verilog; "
+    "synth -flatten -noabc $top; "              # generic synth (runs hierarchy -check), keep gates
+    "opt; clean; aigmap; opt; clean; "          # map to $and/$not only
+    "write_aiger $out"
+)
+# Part of the golden-AIG cache key, so cached AIGs are not reused after the front end changes
+AIG_SCRIPT_HASH = hashlib.sha256(AIG_SCRIPT.template.encode()).hexdigest()[:12]
+
+READABLE_SCRIPT = string.Template(
+    "$frontend; "                               # Process generation
+    "opt; "                                     # Basic opt
+    "alumacc; opt; "                            # Recognize arithmetic patterns
+    "memory; opt; "                             # Memory optimization
+    "techmap; opt; "                            # Technology mapping
+    "abc -dff; "                                # ABC optimization with flip-flops
+    "opt; clean; "                              # Final cleanup
+    "write_verilog -noattr $out"                # Write without attributes
+)
+
+def frontend_script(design: str, top: Optional[str] = None) -> str:
+    """Commands that bring *design* to the post-``proc`` state.
+
+    An ``.il`` file written by :func:`yosys_elaborate` is already there and only needs
+    ``read_rtlil``; Verilog is parsed and elaborated from scratch.
+    """
+    if design.endswith(".il"):
+        return f"read_rtlil {design}"
+    return f"read_verilog {design}; hierarchy -check {top_option(top)}; proc"
+
+def yosys_elaborate(verilog: str, out_il: str, top: Optional[str] = None):
+    """Parse and elaborate *verilog* once, saving the post-``proc`` design as RTLIL"""
+    if not Path(verilog).exists():
+        raise FileNotFoundError(verilog)
+    sh(["yosys", "-q", "-p", f"{frontend_script(verilog, top)}; write_rtlil {out_il}"])
+
 def yosys_to_aig(verilog: str, out_aig: str, top: Optional[str] = None):
     """Original AIG-based synthesis (compact but unreadable)"""
     if not Path(verilog).exists():
         raise FileNotFoundError(verilog)
-    top_cmd = f"-top {top}" if top else ""
-    yosys_script = (
-        f"read_verilog {verilog}; "
-        f"hierarchy -check {top_cmd}; "
-        f"synth -flatten -noabc {top_cmd}; "   # generic synth, keep gates
-        f"opt; clean; aigmap; opt; clean; "     # map to $and/$not only
-        f"write_aiger {out_aig}"
-    )
-    sh(f"yosys -q -p \"{yosys_script}\"")
+    yosys_script = AIG_SCRIPT.substitute(verilog=verilog, top=top_option(top), out=out_aig)
+    sh(["yosys", "-q", "-p", yosys_script])
 
 def yosys_readable_synth(verilog: str, out_v: str, top: Optional[str] = None):
     """Readable synthesis that preserves high-level structures"""
     if not Path(verilog).exists():
         raise FileNotFoundError(verilog)
-    top_cmd = f"-top {top}" if top else ""
-    yosys_script = (
-        f"read_verilog {verilog}; "
-        f"hierarchy -check {top_cmd}; "
-        f"proc; opt; "                          # Process generation and basic opt
-        f"alumacc; opt; "                       # Recognize arithmetic patterns
-        f"memory; opt; "                        # Memory optimization
-        f"techmap; opt; "                       # Technology mapping
-        f"abc -dff; "                           # ABC optimization with flip-flops
-        f"opt; clean; "                         # Final cleanup
-        f"write_verilog -noattr {out_v}"        # Write without attributes
+    yosys_script = READABLE_SCRIPT.substitute(frontend=frontend_script(verilog, top), out=out_v)
+    sh(["yosys", "-q", "-p", yosys_script])
+
+def split_passes(passes: List[str]) -> Tuple[List[str], List[str]]:
+    """Split a mixed sequence into (Yosys passes, ABC passes), keeping order within each"""
+    yosys_seq = [p for p in passes if p and p not in ABC_PASSES]
+    abc_seq = [p for p in passes if p in ABC_PASSES]
+    return yosys_seq, abc_seq
+
+def balanced_tail(abc_passes: Sequence[str] = ()) -> str:
+    """Fixed tail of the balanced flow, run after the Yosys passes.
+
+    ABC passes replace the abc pass's default script (``+`` inline form: commands separated
+    by ``;``, arguments by ``,``), between strashing the netlist and mapping it back.
+    """
+    script = ""
+    if abc_passes:
+        cmds = ";".join(p.replace(" ", ",") for p in ("strash", *abc_passes, "map"))
+        script = f' -script "+{cmds}"'
+    return (
+        "alumacc; "                             # Recognize arithmetic
+        f"abc -liberty /dev/null{script}; "     # ABC optimization
+        "opt; clean"                            # Final cleanup
+    )
+
+def balanced_passes(passes: List[str]) -> str:
+    """Post-``proc`` part of the balanced flow (shared by final synthesis and trials)"""
+    yosys_seq, abc_seq = split_passes(passes)
+    pass_seq = "; ".join(yosys_seq)
+    if not pass_seq:
+        pass_seq = "opt"
+    return f"{pass_seq}; {balanced_tail(abc_seq)}"  # Custom Yosys passes, then the tail
+
+def minimal_passes(passes: List[str]) -> str:
+    """Post-``proc`` part of the minimal flow (shared by final synthesis and trials)"""
+    pass_seq = "; ".join(p for p in passes if p)
+    if not pass_seq:
+        pass_seq = "opt_expr; opt_clean"  # Basic cleanup only
+    return (
+        f"{pass_seq}; "                         # Minimal optimization passes
+        f"opt_clean"                            # Final cleanup
     )
-    sh(f"yosys -q -p \"{yosys_script}\"")
 
 def yosys_balanced_synth(verilog: str, out_v: str, passes: List[str], top: Optional[str] = None):
     """Balanced synthesis with configurable passes"""
     if not Path(verilog).exists():
         raise FileNotFoundError(verilog)
-    top_cmd = f"-top {top}" if top else ""
-    
-    # Build pass sequence
-    pass_seq = "; ".join(p for p in passes if p)
-    if not pass_seq:
-        pass_seq = "opt"
     
     yosys_script = (
-        f"read_verilog {verilog}; "
-        f"hierarchy -check {top_cmd}; "
-        f"proc; "                               # Process generation
-        f"{pass_seq}; "                         # Custom optimization passes
-        f"alumacc; "                            # Recognize arithmetic
-        f"abc -liberty /dev/null; "             # ABC optimization
-        f"opt; clean; "                         # Final cleanup
+        f"{frontend_script(verilog, top)}; "    # Process generation
+        f"{balanced_passes(passes)}; "
         f"write_verilog -noattr {out_v}"        # Write clean Verilog
     )
-    sh(f"yosys -q -p \"{yosys_script}\"")
+    sh(["yosys", "-q", "-p", yosys_script])
 
 def yosys_minimal_synth(verilog: str, out_v: str, passes: List[str], top: Optional[str] = None):
     """Minimal synthesis that preserves RTL structure - NO techmap, NO abc"""
     if not Path(verilog).exists():
         raise FileNotFoundError(verilog)
-    top_cmd = f"-top {top}" if top else ""
-    
-    # Build pass sequence
-    pass_seq = "; ".join(p for p in passes if p)
-    if not pass_seq:
-        pass_seq = "opt_expr; opt_clean"  # Basic cleanup only
     
     yosys_script = (
-        f"read_verilog {verilog}; "
-        f"hierarchy -check {top_cmd}; "
-        f"proc; "                               # Process generation only
-        f"{pass_seq}; "                         # Minimal optimization passes
-        f"opt_clean; "                          # Final cleanup
+        f"{frontend_script(verilog, top)}; "    # Process generation only
+        f"{minimal_passes(passes)}; "
         f"write_verilog -noattr {out_v}"        # Write clean Verilog (NO techmap, NO abc)
     )
-    sh(f"yosys -q -p \"{yosys_script}\"")
+    sh(["yosys", "-q", "-p", yosys_script])
 
 # ───────────────────────── Utils ───────────────────────────────────────
 
 def seq_to_cmd(seq: List[str]) -> str:
     return "; ".join(p for p in seq if p)
 
+def memoize_by_cmd(evaluate: Callable) -> Callable:
+    """Per-study cache for ``evaluate(ctx, seq, ...)`` keyed by the canonical command string.
+
+    TPE often proposes sequences that differ only in NOP placeholders ("" entries); they run
+    the same passes, so the first result is reused instead of re-running Yosys/ABC. One cache
+    per study (the design and weights are fixed within it), so it is bounded by the trial count.
+    Safe to share between concurrent trials.
+    """
+    cache: Dict[str, float] = {}
+    lock = threading.Lock()
+
+    def cached(ctx, seq: List[str], *args) -> float:
+        key = seq_to_cmd(seq)
+        with lock:
+            if key in cache:
+                return cache[key]
+        value = evaluate(ctx, seq, *args)
+        with lock:
+            cache[key] = value
+        return value
+
+    return cached
+
+def seq_space(candidates: List[str], seq_len: int) -> Callable[[optuna.Trial], List[str]]:
+    """Return ``suggest(trial) -> seq`` drawing from the canonical sequences of *candidates*.
+
+    Per-slot categoricals give |C|^L points, most of them duplicates that differ only in where
+    the NOP placeholders sit. Here every sequence of 0..seq_len real passes appears exactly once:
+    as a single categorical over the command strings when the space is small, otherwise as a
+    ``len`` categorical followed by one categorical per used slot (``p0``, ``p1``, ...) over the
+    real passes -- the compacted form, so each slot keeps a meaning TPE can model. The chosen
+    sequence is kept in the trial's ``seq`` user attribute.
+    """
+    passes = list(dict.fromkeys(p for p in candidates if p))
+    sizes = [len(passes) ** k for k in range(seq_len + 1)]
+    total = sum(sizes)
+
+    def decode(index: int) -> List[str]:
+        for length, size in enumerate(sizes):
+            if index < size:
+                break
+            index -= size
+        seq = []
+        for _ in range(length):
+            index, digit = divmod(index, len(passes))
+            seq.append(passes[digit])
+        return seq
+
+    if total <= SEQ_CATEGORICAL_MAX:
+        by_cmd = {seq_to_cmd(seq): seq for seq in map(decode, range(total))}
+        choices = list(by_cmd)
+
+        def suggest(trial) -> List[str]:
+            seq = by_cmd[trial.suggest_categorical("cmd", choices)]
+            trial.set_user_attr("seq", seq)
+            return seq
+    else:
+        lengths = list(range(seq_len + 1))
+
+        def suggest(trial) -> List[str]:
+            length = trial.suggest_categorical("len", lengths)
+            seq = [trial.suggest_categorical(f"p{slot}", passes) for slot in range(length)]
+            trial.set_user_attr("seq", seq)
+            return seq
+
+    return suggest
+
+# ABC ``ps`` output formats, tried in order of preference. Kept as separate patterns rather
+# than one alternation: the leftmost alternative would win, e.g. "lat = 0  and = 42" -> 0.
+ABC_CELLS_RES = (
+    re.compile(r"and\s*=\s*(\d+)"),
+    re.compile(r"(\d+)\s+and"),
+    re.compile(r"gates?\s*:\s*(\d+)"),
+)
+ABC_LEVELS_RES = (
+    re.compile(r"lev\s*=\s*(\d+)"),
+    re.compile(r"level\s*=\s*(\d+)"),
+    re.compile(r"depth\s*=\s*(\d+)"),
+)
+
+def first_match(patterns, text: str) -> Optional[re.Match]:
+    """Match of the first pattern in *patterns* found in *text*"""
+    for pattern in patterns:
+        m = pattern.search(text)
+        if m:
+            return m
+    return None
+
+class SurrogateGate:
+    """Online ridge-regression screen in front of an expensive evaluator.
+
+    Sequences are one-hot encoded per slot. Once SURROGATE_MIN_OBS real costs are known, a
+    sequence predicted to cost more than SURROGATE_MARGIN x the best real cost is not run:
+    the trial is pruned, so predictions are never memoized, stored in the study or learned
+    from by TPE, and the sequence is screened again by later (refit) models. The model is
+    refit every SURROGATE_REFIT observations; failed runs (1e9) are not learned from. Wrap the
+    evaluator before :func:`memoize_by_cmd`, so cache hits are not re-observed.
+    """
+
+    def __init__(self, candidates: List[str], seq_len: int, alpha: float = 1.0):
+        self.index = {p: i for i, p in enumerate(dict.fromkeys(p for p in candidates if p))}
+        self.seq_len = seq_len
+        self.alpha = alpha
+        self.X: List[np.ndarray] = []
+        self.y: List[float] = []
+        self.weights: Optional[np.ndarray] = None
+        self.best = float("inf")
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def encode(self, seq: List[str]) -> np.ndarray:
+        x = np.zeros(self.seq_len * len(self.index) + 1)
+        x[-1] = 1.0  # bias
+        for slot, p in enumerate(p for p in seq if p):
+            x[slot * len(self.index) + self.index[p]] = 1.0
+        return x
+
+    def observe(self, x: np.ndarray, cost: float):
+        with self.lock:
+            self.X.append(x)
+            self.y.append(cost)
+            self.best = min(self.best, cost)
+            n = len(self.y)
+            if n >= SURROGATE_MIN_OBS and (n - SURROGATE_MIN_OBS) % SURROGATE_REFIT == 0:
+                X, y = np.array(self.X), np.array(self.y)
+                self.weights = np.linalg.solve(X.T @ X + self.alpha * np.eye(X.shape[1]), X.T @ y)
+
+    def wrap(self, evaluate: Callable) -> Callable:
+        """Screen calls to ``evaluate(ctx, seq, ...)``"""
+        def screened(ctx, seq: List[str], *args) -> float:
+            x = self.encode(seq)
+            with self.lock:
+                weights, best = self.weights, self.best
+            if weights is not None:
+                predicted = float(x @ weights)
+                if predicted > best * SURROGATE_MARGIN:
+                    with self.lock:
+                        self.skipped += 1
+                    raise optuna.TrialPruned(f"surrogate predicts cost {predicted:.2f}")
+            cost = evaluate(ctx, seq, *args)
+            if cost < 1e9:
+                self.observe(x, cost)
+            return cost
+
+        return screened
+
 # ───────────────────────── QoR evaluation with multiple strategies ───────
 
-def evaluate_aig(golden: Path, seq: List[str], w_delay: float, work: Path) -> float:
-    """Original AIG-based evaluation"""
+def evaluate_aig(golden: Path, seq: List[str], work: Path,
+                 verify: bool = False) -> Tuple[float, float]:
+    """Original AIG-based evaluation, returning ``(cells, levels)``
+
+    Both objectives go to the study separately; the delay weight is applied only when picking
+    from the Pareto front. The candidate passes preserve equivalence, so ``cec`` against the
+    golden AIG only runs with *verify*; otherwise the caller checks the final result once.
+    """
     trial = work / "trial.aig"
+    check = f"write {trial}; cec {golden} {trial}; " if verify else ""
     try:
-        sh(f"abc -q \"read {golden}; {seq_to_cmd(seq)}; write {trial}\"")
-        if "UNSAT" in sh(f"abc -q \"cec {golden} {trial}\""):
-            return 1e9  # functional mismatch
-        
-        stats = sh(f"abc -q \"read {trial}; ps\"")
+        # One ABC run: optimise, optionally check equivalence against the golden AIG, then
+        # print stats of the (still loaded) optimised network
+        stats = sh(["abc", "-q", f"read {golden}; {seq_to_cmd(seq)}; {check}ps"])
+        if "NOT EQUIVALENT" in stats:
+            return 1e9, 1e9  # functional mismatch
         
         # Debug first failure to see actual ABC output format
         if not hasattr(evaluate_aig, '_printed_stats'):
@@ -199,93 +515,88 @@ def evaluate_aig(golden: Path, seq: List[str], w_delay: float, work: Path) -> fl
             evaluate_aig._printed_stats = True
         
         # Try multiple regex patterns for different ABC output formats
-        cells_match = (re.search(r"and\s*=\s*(\d+)", stats) or 
-                      re.search(r"(\d+)\s+and", stats) or
-                      re.search(r"gates?\s*:\s*(\d+)", stats))
-        
-        levels_match = (re.search(r"lev\s*=\s*(\d+)", stats) or
-                       re.search(r"level\s*=\s*(\d+)", stats) or
-                       re.search(r"depth\s*=\s*(\d+)", stats))
+        cells_match = first_match(ABC_CELLS_RES, stats)
+        levels_match = first_match(ABC_LEVELS_RES, stats)
         
         if not cells_match or not levels_match:
-            return 1e9
+            return 1e9, 1e9
             
         cells = int(cells_match.group(1))
         levels = int(levels_match.group(1))
-        return cells + w_delay * levels
+        return cells, levels
         
     except Exception as e:
         if not hasattr(evaluate_aig, '_printed_error'):
             print(f"[DEBUG] First ABC failure: {e}")
             evaluate_aig._printed_error = True
-        return 1e9
+        return 1e9, 1e9
+
+def read_stat(stat_json: Path, key: str) -> int:
+    """Design-wide *key* (e.g. ``num_cells``) from a ``stat -json`` report"""
+    stats = json.loads(stat_json.read_text())
+    
+    # Whole-design totals exist when a top module is known; otherwise add up the modules
+    if "design" in stats:
+        return stats["design"][key]
+    return sum(m[key] for m in stats["modules"].values())
+
+def read_stat_cost(stat_json: Path, w_delay: float) -> float:
+    """Cost from a ``stat -json`` report: cell count plus weighted estimated depth"""
+    cells = read_stat(stat_json, "num_cells")
+    
+    # stat reports no depth; estimate logic levels from the cell count
+    levels = max(1, cells // 10)
+    return cells + w_delay * levels
+
+def evaluate_yosys(session: YosysSession, passes: List[str], w_delay: float, work: Path,
+                   trial: Optional[optuna.Trial] = None) -> float:
+    """Evaluate using Yosys-only optimization
 
-def evaluate_yosys(verilog: Path, passes: List[str], w_delay: float, work: Path, top: Optional[str] = None) -> float:
-    """Evaluate using Yosys-only optimization"""
+    With *trial*, the passes run one at a time and the cost after each is reported as an
+    intermediate value, so the study's pruner can stop a losing trial before the ABC tail.
+    """
     try:
-        trial_v = work / "trial.v"
-        yosys_balanced_synth(str(verilog), str(trial_v), passes, top)
-        
-        # Get statistics from Yosys
-        stats_script = (
-            f"read_verilog {trial_v}; "
-            f"hierarchy -check; "
-            f"stat"
-        )
-        stats = sh(f"yosys -q -p \"{stats_script}\"")
-        
-        # Parse Yosys statistics
-        cells_match = re.search(r"Number of cells:\s*(\d+)", stats)
-        # For delay estimation, count logic levels (approximate)
-        levels_match = re.search(r"Estimated number of logic levels:\s*(\d+)", stats)
+        # Run the balanced flow on the session's parsed design; stat goes to a file since -q hides it
+        stat_json = work / "trial_stat.json"
+        stat = f"tee -q -o {stat_json} stat -json"
+        steps, abc_seq = split_passes(passes)
+        if trial is None or not steps:
+            session.run(f"{balanced_passes(passes)}; {stat}")
+            return read_stat_cost(stat_json, w_delay)
         
-        if not cells_match:
-            # Fallback: count basic gates
-            and_gates = len(re.findall(r'\$and\b', stats))
-            or_gates = len(re.findall(r'\$or\b', stats))
-            cells = and_gates + or_gates + 1  # +1 to avoid zero
-        else:
-            cells = int(cells_match.group(1))
-            
-        if not levels_match:
-            levels = max(1, cells // 10)  # Rough estimate
-        else:
-            levels = int(levels_match.group(1))
-            
-        return cells + w_delay * levels
+        for step, p in enumerate(steps):
+            session.run(f"{p}; {stat}", fresh=step == 0)
+            trial.report(read_stat_cost(stat_json, w_delay), step)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+        session.run(f"{balanced_tail(abc_seq)}; {stat}", fresh=False)
+        return read_stat_cost(stat_json, w_delay)
         
+    except optuna.TrialPruned:
+        raise
     except Exception as e:
         if not hasattr(evaluate_yosys, '_printed_error'):
             print(f"[DEBUG] First Yosys evaluation failure: {e}")
             evaluate_yosys._printed_error = True
         return 1e9
 
-def evaluate_minimal(verilog: Path, passes: List[str], w_delay: float, work: Path, top: Optional[str] = None) -> float:
+def evaluate_minimal(session: YosysSession, passes: List[str], w_delay: float, work: Path) -> float:
     """Evaluate using minimal optimization - focus on preserving structure"""
     try:
-        trial_v = work / "trial.v"
-        yosys_minimal_synth(str(verilog), str(trial_v), passes, top)
-        
-        # Read the generated Verilog and count lines/complexity
-        with open(trial_v, 'r') as f:
-            content = f.read()
-        
-        # Simple metrics for RTL-level optimization
-        lines = len(content.splitlines())
-        wire_count = content.count('wire ')
-        assign_count = content.count('assign ')
+        # Count cells and wires in the netlist itself; no Verilog is written during trials
+        stat_json = work / "trial_stat.json"
+        session.run(f"{minimal_passes(passes)}; tee -q -o {stat_json} stat -json")
+        cells = read_stat(stat_json, "num_cells")
+        wires = read_stat(stat_json, "num_wires")
         
         # Penalty for wire explosion (sign of gate-level decomposition)
-        wire_penalty = max(0, wire_count - 10) * 5  # Heavy penalty for many wires
-        
-        # Reward for keeping assign statements (sign of RTL preservation)
-        assign_reward = max(0, 10 - assign_count) * 2  # Prefer fewer, cleaner assigns
+        wire_penalty = max(0, wires - 10) * 5  # Heavy penalty for many wires
         
         # Basic complexity score
-        complexity = lines + wire_penalty + assign_reward
+        complexity = cells + wire_penalty
         
-        # Add minimal delay estimate (just use line count as proxy)
-        levels = max(1, lines // 20)
+        # Add minimal delay estimate from the cell count
+        levels = max(1, cells // 10)
         
         return complexity + w_delay * levels
         
@@ -297,67 +608,323 @@ def evaluate_minimal(verilog: Path, passes: List[str], w_delay: float, work: Pat
 
 # ───────────────────────── Enhanced optimization function ──────────────────
 
+def study_name_for(rtl: Path, top: Optional[str], seq_len: int, w_delay: float,
+                   strategy: OptimizationStrategy) -> str:
+    """Study name shared by runs whose trials are interchangeable (same RTL and settings)"""
+    key = hashlib.sha256(rtl.read_bytes())
+    key.update(f"|{top}|{seq_len}|{w_delay}".encode())
+    return f"{strategy.value}-{key.hexdigest()[:16]}"
+
 def optimise(rtl: Path, top: Optional[str], trials: int, seq_len: int,
-             w_delay: float, out_dir: Path, strategy: OptimizationStrategy = OptimizationStrategy.READABLE):
+             w_delay: float, out_dir: Path, strategy: OptimizationStrategy = OptimizationStrategy.READABLE,
+             golden_cache: Optional[Path] = None, n_jobs: int = 1, verify: bool = False,
+             persist: bool = False, fresh: bool = False, early_stop: bool = False,
+             surrogate: bool = False):
+    """Run *strategy* on *rtl*, writing results to *out_dir*.
+
+    With *persist*, trials are stored in ``out_dir/study.db`` and a later run with the same
+    RTL and settings continues that study; *fresh* discards it first. *early_stop* ends the
+    search once it has converged; *surrogate* screens Yosys trials with a :class:`SurrogateGate`.
+    """
     out_dir.mkdir(parents=True, exist_ok=True)
     
     print(f"[+] Using optimization strategy: {strategy.value}")
     
+    storage = study_name = None
+    if persist:
+        storage = f"sqlite:///{(out_dir / STUDY_DB).resolve()}"
+        study_name = study_name_for(rtl, top, seq_len, w_delay, strategy)
+        if fresh:
+            for name in (study_name, f"{study_name}-verify"):
+                try:
+                    optuna.delete_study(study_name=name, storage=storage)
+                except KeyError:
+                    pass  # nothing stored yet
+        print(f"[+] Optuna study: {study_name} ({out_dir / STUDY_DB})")
+    
     if strategy == OptimizationStrategy.AIG_BASED:
-        return optimise_aig_based(rtl, top, trials, seq_len, w_delay, out_dir)
-    elif strategy == OptimizationStrategy.READABLE:
-        return optimise_readable(rtl, top, trials, seq_len, w_delay, out_dir)
-    elif strategy == OptimizationStrategy.BALANCED:
-        return optimise_balanced(rtl, top, trials, seq_len, w_delay, out_dir)
-    elif strategy == OptimizationStrategy.YOSYS_ONLY:
-        return optimise_yosys_only(rtl, top, trials, seq_len, w_delay, out_dir)
-    elif strategy == OptimizationStrategy.MINIMAL:
-        return optimise_minimal(rtl, top, trials, seq_len, w_delay, out_dir)
+        return optimise_aig_based(rtl, top, trials, seq_len, w_delay, out_dir, golden_cache, n_jobs,
+                                  verify, storage, study_name, early_stop)
+    
+    # The Yosys strategies parse the RTL once; every session and the final synthesis then
+    # start from the elaborated RTLIL instead of re-running read_verilog/hierarchy/proc
+    with tempfile.TemporaryDirectory(prefix="vop_il_", dir=SCRATCH_DIR) as tmp:
+        base_il = Path(tmp) / "base.il"
+        yosys_elaborate(str(rtl), str(base_il), top)
+        if strategy == OptimizationStrategy.READABLE:
+            return optimise_readable(base_il, top, trials, seq_len, w_delay, out_dir, n_jobs,
+                                     storage, study_name, early_stop, surrogate)
+        elif strategy == OptimizationStrategy.BALANCED:
+            return optimise_balanced(base_il, top, trials, seq_len, w_delay, out_dir, n_jobs,
+                                     storage, study_name, early_stop, surrogate)
+        elif strategy == OptimizationStrategy.YOSYS_ONLY:
+            return optimise_yosys_only(base_il, top, trials, seq_len, w_delay, out_dir, n_jobs,
+                                       storage, study_name, early_stop, surrogate)
+        elif strategy == OptimizationStrategy.MINIMAL:
+            return optimise_minimal(base_il, top, trials, seq_len, w_delay, out_dir, n_jobs,
+                                    storage, study_name, early_stop, surrogate)
+
+def optimise_batch(rtl: Path, top: Optional[str], trials: int, seq_len: int, w_delay: float,
+                   out_dir_prefix: str, strategies: List[OptimizationStrategy],
+                   golden_cache: Optional[Path] = None, n_jobs: int = 1,
+                   verify: bool = False, persist: bool = False,
+                   fresh: bool = False, early_stop: bool = False,
+                   surrogate: bool = False) -> List[OptimizationStrategy]:
+    """Run several strategies in one process (shared imports, concurrent Yosys/ABC work).
+
+    Each strategy writes to ``<out_dir_prefix><strategy>``. Returns the strategies that raised.
+    """
+    def run(strategy: OptimizationStrategy):
+        optimise(rtl, top, trials, seq_len, w_delay,
+                 Path(f"{out_dir_prefix}{strategy.value}"), strategy, golden_cache, n_jobs, verify,
+                 persist, fresh, early_stop, surrogate)
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=len(strategies)) as pool:
+        futures = {strategy: pool.submit(run, strategy) for strategy in strategies}
+        for strategy, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"✗ Strategy {strategy.value} failed: {e}")
+                failed.append(strategy)
+    return failed
+
+def run_optimization(verilog_text: str, strategy: str, n_trials: int, seq_len: int = 6,
+                     delay_w: float = DELAY_WEIGHT_DEFAULT,
+                     top: Optional[str] = None, n_jobs: int = 1) -> Dict[str, Optional[str]]:
+    """In-process entry point for services: optimise *verilog_text*, return the code as strings.
+
+    Yosys/ABC still need files, so a private scratch directory (on tmpfs if available) is used
+    and removed here.
+    ``optimized`` is None when no trial beat the baseline; ``baseline`` is None if none was written.
+    """
+    with tempfile.TemporaryDirectory(prefix="vop_run_", dir=SCRATCH_DIR) as tmp:
+        work = Path(tmp)
+        rtl = work / "input.v"
+        rtl.write_text(verilog_text)
+        out_dir = work / "output"
+        optimise(rtl, top, n_trials, seq_len, delay_w, out_dir, OptimizationStrategy(strategy),
+                 n_jobs=n_jobs)
+
+        # One directory read finds both outputs, whatever suffix the strategy used.
+        best = baseline = None
+        with os.scandir(out_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".v") or not entry.is_file():
+                    continue
+                if entry.name.startswith("best_opt"):
+                    best = entry.path
+                elif entry.name.startswith("baseline"):
+                    baseline = entry.path
+        return {
+            "optimized": Path(best).read_text() if best else None,
+            "baseline": Path(baseline).read_text() if baseline else None,
+        }
+
+def warmup() -> None:
+    """Pay optuna's lazy imports (TPE sampler, in-memory storage) up front.
+
+    Meant for long-lived processes that jobs are forked from (e.g. a forkserver), so the first
+    job is not slower.
+    """
+    study = optuna.create_study(direction="minimize", sampler=optuna.samplers.TPESampler())
+    trial = study.ask()
+    seq_space(PASS_CANDIDATES, 1)(trial)
+    study.tell(trial, 0.0)
+
+def converged_callback(window: int = EARLY_STOP_WINDOW,
+                       max_distinct: int = EARLY_STOP_DISTINCT) -> Callable:
+    """Optuna callback that stops the study once the search has converged.
+
+    Converged means the last *window* trials ran at most *max_distinct* canonical commands:
+    TPE keeps re-proposing the same region, so the rest of the budget would mostly hit the
+    memo cache. Tracked locally so storage is not re-read after every trial.
+    """
+    recent = deque(maxlen=window)
+    lock = threading.Lock()
+
+    def callback(study, trial):
+        seq = trial.user_attrs.get("seq")
+        if seq is None:  # failed before a sequence was drawn
+            return
+        with lock:
+            recent.append(seq_to_cmd(seq))
+            converged = len(recent) == window and len(set(recent)) <= max_distinct
+        if converged:
+            print(f"[+] Early stop: last {window} trials ran {len(set(recent))} distinct sequences")
+            study.stop()
+
+    return callback
+
+def run_study(objective: Callable, trials: int, n_jobs: int,
+              rtl: Optional[Path] = None, top: Optional[str] = None,
+              storage: Optional[str] = None, study_name: Optional[str] = None,
+              early_stop: bool = False, directions: Optional[List[str]] = None,
+              show_progress_bar: Optional[bool] = None) -> optuna.Study:
+    """Run a TPE study with up to *n_jobs* trials in flight.
+
+    Trials run on Optuna's worker threads; the cost is in Yosys/ABC child processes, so
+    threads scale with cores. Each concurrent trial borrows a private slot -- its own
+    work dir and, when *rtl* is given, its own YosysSession -- and is called as
+    ``objective(trial, session, work_dir)``. Work dirs live in a scratch dir (tmpfs when
+    available) that is removed when the study ends.
+
+    With *storage* (an RDB URL) and *study_name*, trials are recorded there and an existing
+    study of that name is continued, so TPE starts from the earlier observations.
+    With *early_stop*, the study stops once the sampler keeps proposing the same few sequences
+    (see :func:`converged_callback`). *directions* makes it a multi-objective study, for
+    objectives returning one value per direction. The progress bar is shown by default only
+    when stderr is a terminal, so logs of API and batch runs are not flooded with it.
+    """
+    if show_progress_bar is None:
+        show_progress_bar = sys.stderr.isatty()
+    n_jobs = max(1, min(n_jobs, trials, os.cpu_count() or 1))
+    slots = queue.SimpleQueue()
+    sessions = []
+    scratch = Path(tempfile.mkdtemp(prefix="vop_trials_", dir=SCRATCH_DIR))
+    try:
+        for i in range(n_jobs):
+            slot_dir = scratch / f"worker{i}"
+            slot_dir.mkdir()
+            session = None
+            if rtl is not None:
+                session = YosysSession(str(rtl), top)
+                sessions.append(session)
+            slots.put((session, slot_dir))
+
+        def slotted(trial):
+            slot = slots.get()
+            try:
+                return objective(trial, *slot)
+            finally:
+                slots.put(slot)
+
+        if storage:
+            # Several processes may share the file; wait for SQLite locks instead of failing
+            storage = optuna.storages.RDBStorage(
+                storage, engine_kwargs={"connect_args": {"timeout": STUDY_DB_TIMEOUT}})
+        # Evaluators that report per-pass costs get trials stopped once they fall behind
+        # the median of earlier trials at the same step; others are unaffected. Optuna does
+        # not support pruning multi-objective studies, so those get no pruner
+        pruner = (optuna.pruners.NopPruner() if directions else
+                  optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=2))
+        # TPESampler covers the multi-objective case too (MOTPE)
+        study = optuna.create_study(direction=None if directions else "minimize",
+                                    directions=directions,
+                                    sampler=optuna.samplers.TPESampler(), pruner=pruner,
+                                    storage=storage, study_name=study_name, load_if_exists=True)
+        callbacks = [converged_callback()] if early_stop else None
+        study.optimize(slotted, n_trials=trials, n_jobs=n_jobs,
+                       show_progress_bar=show_progress_bar, callbacks=callbacks)
+        return study
+    finally:
+        for session in sessions:
+            session.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def search_netlist(candidates: List[str], evaluate: Callable, rtl: Path, top: Optional[str],
+                   trials: int, seq_len: int, w_delay: float, n_jobs: int,
+                   storage: Optional[str], study_name: Optional[str], early_stop: bool,
+                   surrogate: bool, pass_trial: bool = True) -> optuna.Study:
+    """Search pass sequences drawn from *candidates* on per-slot Yosys sessions of *rtl*.
+
+    Trials are scored by ``evaluate(session, seq, w_delay, work[, trial])`` -- the trial is
+    passed when *pass_trial*, for evaluators that report per-pass costs to the pruner. The
+    evaluator is memoized per command and, with *surrogate*, screened by a
+    :class:`SurrogateGate` first.
+    """
+    suggest_seq = seq_space(candidates, seq_len)
+    gate = SurrogateGate(candidates, seq_len) if surrogate else None
+    evaluate = memoize_by_cmd(gate.wrap(evaluate) if gate else evaluate)
+
+    def objective(trial, session, work):
+        seq = suggest_seq(trial)
+        if pass_trial:
+            return evaluate(session, seq, w_delay, work, trial)
+        return evaluate(session, seq, w_delay, work)
+
+    study = run_study(objective, trials, n_jobs, rtl, top, storage, study_name, early_stop)
+    if gate:
+        print(f"[+] Surrogate skipped {gate.skipped} Yosys runs")
+    return study
 
 def optimise_aig_based(rtl: Path, top: Optional[str], trials: int, seq_len: int,
-                      w_delay: float, out_dir: Path):
+                      w_delay: float, out_dir: Path, golden_cache: Optional[Path] = None,
+                      n_jobs: int = 1, verify: bool = False,
+                      storage: Optional[str] = None, study_name: Optional[str] = None,
+                      early_stop: bool = False):
     """Original AIG-based optimization"""
     golden = out_dir / "golden.aig"
     
     # Check ABC installation
     try:
-        abc_version = sh("abc -q \"version\"")
+        abc_version = sh(["abc", "-q", "version"])
         print(f"[+] ABC version: {abc_version.strip()}")
     except Exception as e:
         print(f"✗ ABC not found or not working: {e}")
         print("Please install ABC: https://github.com/berkeley-abc/abc")
         return
     
-    print("[+] Yosys: RTL → AIG …")
-    yosys_to_aig(str(rtl), str(golden), top)
+    if golden_cache and golden_cache.exists():
+        # 同一份 RTL 已经解析过，直接复用缓存的 AIG
+        print(f"[+] Reusing cached AIG: {golden_cache}")
+        shutil.copyfile(golden_cache, golden)
+    else:
+        print("[+] Yosys: RTL → AIG …")
+        yosys_to_aig(str(rtl), str(golden), top)
+        if golden_cache:
+            # Copy under a private name and rename into place: concurrent runs (batch mode)
+            # only ever see a missing or a complete cache file
+            golden_cache.parent.mkdir(parents=True, exist_ok=True)
+            partial = golden_cache.with_name(
+                f"{golden_cache.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            shutil.copyfile(golden, partial)
+            os.replace(partial, golden_cache)
 
-    print(f"[+] Optuna search: trials={trials}, seq_len={seq_len}")
+    print(f"[+] Optuna search: trials={trials}, seq_len={seq_len}, n_jobs={n_jobs}")
 
-    def objective(trial):
-        seq = [trial.suggest_categorical(f"p{i}", PASS_CANDIDATES) for i in range(seq_len)]
-        return evaluate_aig(golden, seq, w_delay, out_dir)
+    suggest_seq = seq_space(PASS_CANDIDATES + PASS_CANDIDATES_GIA, seq_len)
+    best_aig = out_dir / "best.aig"
+    best_v   = out_dir / "best_opt.v"
+    while True:
+        evaluate = memoize_by_cmd(evaluate_aig)
+        def objective(trial, session, work):
+            seq = suggest_seq(trial)
+            return evaluate(golden, seq, work, verify)
 
-    study = optuna.create_study(direction="minimize",
-                                sampler=optuna.samplers.TPESampler())
-    study.optimize(objective, n_trials=trials, show_progress_bar=True)
+        # Unverified trials may score a broken sequence, so verified runs keep a separate study
+        name = f"{study_name}-verify" if study_name and verify else study_name
+        study = run_study(objective, trials, n_jobs, storage=storage, study_name=name,
+                          early_stop=early_stop, directions=["minimize", "minimize"])
 
-    best_seq = [v for k, v in sorted(study.best_trial.params.items()) if v]
-    print(f"\n★ Best cost : {study.best_value}")
-    print("★ Best seq  :", seq_to_cmd(best_seq) or "<empty>")
+        # Area and depth are searched jointly; the delay weight picks one point of the front
+        best = min(study.best_trials, key=lambda t: t.values[0] + w_delay * t.values[1])
+        best_seq = best.user_attrs["seq"]
+        cells, levels = best.values
+        print(f"\n★ Pareto front: {len(study.best_trials)} trials")
+        print(f"★ Best cost : {cells + w_delay * levels} (cells={cells:g}, levels={levels:g})")
+        print("★ Best seq  :", seq_to_cmd(best_seq) or "<empty>")
 
-    if study.best_value >= 1e9:
-        print("✗ All optimization trials failed! Check ABC installation or try simpler passes.")
-        return
+        if cells >= 1e9:
+            print("✗ All optimization trials failed! Check ABC installation or try simpler passes.")
+            return
 
-    best_aig = out_dir / "best.aig"
-    best_v   = out_dir / "best_opt.v"
-    sh(f"abc -q \"read {golden}; {seq_to_cmd(best_seq)}; write {best_aig}\"")
-    sh(f"yosys -q -p \"read_aiger {best_aig}; write_verilog {best_v}\"")
+        sh(["abc", "-q", f"read {golden}; {seq_to_cmd(best_seq)}; write {best_aig}"])
+        # Without per-trial verification the winner is checked once here
+        if verify or "NOT EQUIVALENT" not in sh(["abc", "-q", f"cec {golden} {best_aig}"]):
+            break
+        print("⚠️  Best sequence is not equivalent to the golden AIG; re-running with --verify")
+        verify = True
+
+    sh(["yosys", "-q", "-p", f"read_aiger {best_aig}; write_verilog {best_v}"])
     print(f"[✓] Optimised Verilog: {best_v}")
     print(f"[!] Warning: AIG-based output may be difficult to read")
 
 def optimise_readable(rtl: Path, top: Optional[str], trials: int, seq_len: int,
-                     w_delay: float, out_dir: Path):
+                     w_delay: float, out_dir: Path, n_jobs: int = 1,
+                     storage: Optional[str] = None, study_name: Optional[str] = None,
+                     early_stop: bool = False, surrogate: bool = False):
     """Optimization focused on readability"""
     print("[+] Readable synthesis optimization...")
     
@@ -366,15 +933,10 @@ def optimise_readable(rtl: Path, top: Optional[str], trials: int, seq_len: int,
     yosys_readable_synth(str(rtl), str(baseline_v), top)
     
     # Then optimize using Yosys passes
-    def objective(trial):
-        seq = [trial.suggest_categorical(f"p{i}", YOSYS_PASS_CANDIDATES) for i in range(seq_len)]
-        return evaluate_yosys(rtl, seq, w_delay, out_dir, top)
-
-    study = optuna.create_study(direction="minimize",
-                                sampler=optuna.samplers.TPESampler())
-    study.optimize(objective, n_trials=trials, show_progress_bar=True)
+    study = search_netlist(YOSYS_PASS_CANDIDATES, evaluate_yosys, rtl, top, trials, seq_len,
+                           w_delay, n_jobs, storage, study_name, early_stop, surrogate)
 
-    best_seq = [v for k, v in sorted(study.best_trial.params.items()) if v]
+    best_seq = study.best_trial.user_attrs["seq"]
     print(f"\n★ Best cost : {study.best_value}")
     print("★ Best seq  :", seq_to_cmd(best_seq) or "<empty>")
 
@@ -389,24 +951,19 @@ def optimise_readable(rtl: Path, top: Optional[str], trials: int, seq_len: int,
     print(f"[✓] Baseline readable version: {baseline_v}")
 
 def optimise_balanced(rtl: Path, top: Optional[str], trials: int, seq_len: int,
-                     w_delay: float, out_dir: Path):
+                     w_delay: float, out_dir: Path, n_jobs: int = 1,
+                     storage: Optional[str] = None, study_name: Optional[str] = None,
+                     early_stop: bool = False, surrogate: bool = False):
     """Balanced optimization between size and readability"""
     print("[+] Balanced optimization strategy...")
     
     # Use both ABC and Yosys passes
     combined_passes = PASS_CANDIDATES + YOSYS_PASS_CANDIDATES
     
-    def objective(trial):
-        seq = [trial.suggest_categorical(f"p{i}", combined_passes) for i in range(seq_len)]
-        # Try to evaluate with both methods and take the better result
-        yosys_score = evaluate_yosys(rtl, seq, w_delay, out_dir, top)
-        return yosys_score
+    study = search_netlist(combined_passes, evaluate_yosys, rtl, top, trials, seq_len,
+                           w_delay, n_jobs, storage, study_name, early_stop, surrogate)
 
-    study = optuna.create_study(direction="minimize",
-                                sampler=optuna.samplers.TPESampler())
-    study.optimize(objective, n_trials=trials, show_progress_bar=True)
-
-    best_seq = [v for k, v in sorted(study.best_trial.params.items()) if v]
+    best_seq = study.best_trial.user_attrs["seq"]
     print(f"\n★ Best cost : {study.best_value}")
     print("★ Best seq  :", seq_to_cmd(best_seq) or "<empty>")
 
@@ -419,19 +976,16 @@ def optimise_balanced(rtl: Path, top: Optional[str], trials: int, seq_len: int,
     print(f"[✓] Balanced optimised Verilog: {best_v}")
 
 def optimise_yosys_only(rtl: Path, top: Optional[str], trials: int, seq_len: int,
-                       w_delay: float, out_dir: Path):
+                       w_delay: float, out_dir: Path, n_jobs: int = 1,
+                       storage: Optional[str] = None, study_name: Optional[str] = None,
+                       early_stop: bool = False, surrogate: bool = False):
     """Pure Yosys optimization without ABC"""
     print("[+] Yosys-only optimization...")
     
-    def objective(trial):
-        seq = [trial.suggest_categorical(f"p{i}", YOSYS_PASS_CANDIDATES) for i in range(seq_len)]
-        return evaluate_yosys(rtl, seq, w_delay, out_dir, top)
-
-    study = optuna.create_study(direction="minimize",
-                                sampler=optuna.samplers.TPESampler())
-    study.optimize(objective, n_trials=trials, show_progress_bar=True)
+    study = search_netlist(YOSYS_PASS_CANDIDATES, evaluate_yosys, rtl, top, trials, seq_len,
+                           w_delay, n_jobs, storage, study_name, early_stop, surrogate)
 
-    best_seq = [v for k, v in sorted(study.best_trial.params.items()) if v]
+    best_seq = study.best_trial.user_attrs["seq"]
     print(f"\n★ Best cost : {study.best_value}")
     print("★ Best seq  :", seq_to_cmd(best_seq) or "<empty>")
 
@@ -444,7 +998,9 @@ def optimise_yosys_only(rtl: Path, top: Optional[str], trials: int, seq_len: int
     print(f"[✓] Yosys-optimised Verilog: {best_v}")
 
 def optimise_minimal(rtl: Path, top: Optional[str], trials: int, seq_len: int,
-                    w_delay: float, out_dir: Path):
+                    w_delay: float, out_dir: Path, n_jobs: int = 1,
+                    storage: Optional[str] = None, study_name: Optional[str] = None,
+                    early_stop: bool = False, surrogate: bool = False):
     """Minimal optimization that preserves RTL structure"""
     print("[+] Minimal optimization - preserving RTL structure...")
     
@@ -454,15 +1010,11 @@ def optimise_minimal(rtl: Path, top: Optional[str], trials: int, seq_len: int,
     print(f"[✓] Baseline (no optimization): {baseline_v}")
     
     # Then try minimal optimizations
-    def objective(trial):
-        seq = [trial.suggest_categorical(f"p{i}", MINIMAL_PASS_CANDIDATES) for i in range(seq_len)]
-        return evaluate_minimal(rtl, seq, w_delay, out_dir, top)
+    study = search_netlist(MINIMAL_PASS_CANDIDATES, evaluate_minimal, rtl, top, trials, seq_len,
+                           w_delay, n_jobs, storage, study_name, early_stop, surrogate,
+                           pass_trial=False)
 
-    study = optuna.create_study(direction="minimize",
-                                sampler=optuna.samplers.TPESampler())
-    study.optimize(objective, n_trials=trials, show_progress_bar=True)
-
-    best_seq = [v for k, v in sorted(study.best_trial.params.items()) if v]
+    best_seq = study.best_trial.user_attrs["seq"]
     print(f"\n★ Best cost : {study.best_value}")
     print("★ Best seq  :", seq_to_cmd(best_seq) or "<empty>")
 
@@ -479,7 +1031,7 @@ def optimise_minimal(rtl: Path, top: Optional[str], trials: int, seq_len: int,
 
 # ───────────────────────── CLI & entry ──────────────────────────────────
 
-def parse_args():
+def parse_args(argv: Optional[List[str]] = None):
     p = argparse.ArgumentParser(description="Bayesian‑optimise logic synthesis for Verilog designs")
     p.add_argument("verilog", nargs="?", help="Input Verilog (default: built‑in demo)")
     p.add_argument("--top", help="Top module name (if auto fails)")
@@ -487,14 +1039,33 @@ def parse_args():
     p.add_argument("-l", "--seq-len",  type=int, default=6)
     p.add_argument("-w", "--delay-w",  type=float, default=DELAY_WEIGHT_DEFAULT)
     p.add_argument("-o", "--out-dir",  default="bo_out")
+    p.add_argument("-j", "--n-jobs",   type=int, default=1,
+                   help="Concurrent Optuna trials, each with its own Yosys session (capped at CPU count)")
+    p.add_argument("--verify", action="store_true",
+                   help="aig strategy: run cec on every trial (default: only on the best result)")
+    p.add_argument("--early-stop", action="store_true",
+                   help=f"Stop once the last {EARLY_STOP_WINDOW} trials repeat at most "
+                        f"{EARLY_STOP_DISTINCT} distinct sequences")
+    p.add_argument("--surrogate", action="store_true",
+                   help="Yosys strategies: skip trials a ridge-regression model predicts to be poor")
+    p.add_argument("--fresh", action="store_true",
+                   help=f"Discard trials stored in <out-dir>/{STUDY_DB} for this RTL and settings")
     p.add_argument("--strategy", choices=[s.value for s in OptimizationStrategy], 
                    default=OptimizationStrategy.MINIMAL.value,
                    help="Optimization strategy: minimal (preserve RTL), readable (clean), balanced, yosys_only, aig (compact)")
-    return p.parse_args()
+    p.add_argument("--strategies",
+                   help="Comma-separated strategies to run in one process (batch mode, overrides --strategy)")
+    p.add_argument("--out-dir-prefix",
+                   help="Batch mode: each strategy writes to <prefix><strategy> (default: <out-dir>_)")
+    p.add_argument("--cache-key", help="Content hash of the RTL; reuse the parsed AIG across runs")
+    p.add_argument("--cache-dir", default=str(Path(tempfile.gettempdir()) / "vop_cache"),
+                   help="Directory for parsed-design cache (used with --cache-key)")
+    return p.parse_args(argv)
 
 
-def main():
-    args = parse_args()
+def main(argv: Optional[List[str]] = None):
+    """CLI entry; pass *argv* to run in-process (e.g. from a test harness) without spawning Python."""
+    args = parse_args(argv)
     if args.verilog:
         rtl = Path(args.verilog).resolve()
     else:
@@ -503,9 +1074,31 @@ def main():
         rtl.write_text(SAMPLE_RTL)
         print(f"[i] No RTL provided, using built‑in sample → {rtl}")
 
+    golden_cache = None
+    if args.cache_key:
+        golden_cache = (Path(args.cache_dir) /
+                        f"{args.cache_key}-{args.top or 'auto'}-{AIG_SCRIPT_HASH}.aig")
+
+    if args.strategies:
+        names = [s.strip() for s in args.strategies.split(",") if s.strip()]
+        valid = {s.value for s in OptimizationStrategy}
+        unknown = [s for s in names if s not in valid]
+        if unknown or not names:
+            sys.exit(f"Unknown strategies: {', '.join(unknown) or '<empty>'}")
+        prefix = args.out_dir_prefix or f"{args.out_dir}_"
+        failed = optimise_batch(rtl, args.top, args.n_trials, args.seq_len, args.delay_w,
+                                prefix, [OptimizationStrategy(s) for s in names], golden_cache, args.n_jobs,
+                                args.verify, persist=True, fresh=args.fresh,
+                                early_stop=args.early_stop, surrogate=args.surrogate)
+        if failed:
+            sys.exit(1)
+        return
+
     strategy = OptimizationStrategy(args.strategy)
     optimise(rtl, args.top, args.n_trials, args.seq_len,
-             args.delay_w, Path(args.out_dir), strategy)
+             args.delay_w, Path(args.out_dir), strategy, golden_cache, args.n_jobs, args.verify,
+             persist=True, fresh=args.fresh, early_stop=args.early_stop,
+             surrogate=args.surrogate)
 
 
 if __name__ == "__main__":
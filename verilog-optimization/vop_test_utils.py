@@ -0,0 +1,85 @@
+"""
+vop.py 测试脚本（test_minimal / test_strategies / test_comparison）共用的辅助函数
+"""
+
+import hashlib
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+# 内嵌设计写到 tmpfs（没有则用临时目录），本次运行的所有 vop.py 调用共用这一份输入
+TEST_DIR = Path("/dev/shm" if Path("/dev/shm").is_dir() else tempfile.gettempdir()) / "vop_tests"
+
+# 子进程只继承运行 vop.py 所需的环境变量，构建一次后复用：yosys/abc 通过 PATH 查找，
+# 部分安装依赖动态库加载路径和 locale；HOME/PYTHONPATH/VIRTUAL_ENV 保证依赖仍可导入
+ENV_PASSTHROUGH = ("PATH", "HOME", "TMPDIR", "PYTHONPATH", "VIRTUAL_ENV",
+                   "LD_LIBRARY_PATH", "DYLD_LIBRARY_PATH", "LANG", "LANGUAGE")
+BASE_ENV = {k: v for k, v in os.environ.items() if k in ENV_PASSTHROUGH or k.startswith("LC_")}
+# 子进程不再以 -I 运行，PYTHON* 变量会生效：固定哈希种子，各次运行的结果可复现
+BASE_ENV["PYTHONHASHSEED"] = "0"
+
+# 用当前解释器运行 vop.py 的命令前缀；不加 -I：隔离模式会忽略用户级 site-packages 和 PYTHONPATH，
+# pip install --user 安装的 optuna 等依赖将无法导入
+VOP_CMD = [sys.executable, "vop.py"]
+
+LOG_TAIL_BYTES = 64 * 1024  # 出错时只需要日志末尾
+
+def stage_design(filename: str, design: str) -> str:
+    """把测试设计写到 TEST_DIR/filename 并返回路径"""
+    TEST_DIR.mkdir(parents=True, exist_ok=True)
+    test_file = TEST_DIR / filename
+    test_file.write_text(design)
+    return str(test_file)
+
+def discard_dir(path) -> None:
+    """移走旧目录并在后台线程删除：rename 是 O(1)，递归删除不阻塞新一轮运行"""
+    old = Path(path)
+    if not old.exists():
+        return
+    trash = old.with_name(f"{old.name}.trash.{os.getpid()}.{time.time_ns()}")
+    old.rename(trash)
+    # 非守护线程：解释器退出前会等待删除完成，不留下 .trash 目录
+    threading.Thread(target=shutil.rmtree, args=(trash,), kwargs={"ignore_errors": True}).start()
+
+def read_log_tail(out) -> str:
+    """读取日志文件末尾 LOG_TAIL_BYTES 字节"""
+    size = out.seek(0, os.SEEK_END)
+    out.seek(max(0, size - LOG_TAIL_BYTES))
+    return out.read().decode("utf-8", "replace")
+
+def run_logged(cmd: list, timeout: int):
+    """运行命令，stdout/stderr 写入临时文件而非内存，返回 (returncode, 日志末尾 LOG_TAIL_BYTES 字节)
+    
+    命令在独立的会话（进程组）中运行：超时时连同 yosys/abc 子进程一起结束，再抛出 subprocess.TimeoutExpired
+    """
+    with tempfile.TemporaryFile() as out:
+        # 这些脚本不持有需要对子进程隐藏的描述符，close_fds=False 省去逐个关闭 fd 的开销
+        with subprocess.Popen(cmd, stdout=out, stderr=subprocess.STDOUT, env=BASE_ENV,
+                              close_fds=False, start_new_session=True) as proc:
+            try:
+                proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                proc.wait()
+                raise
+        return proc.returncode, read_log_tail(out)
+
+# 结果缓存：设置 VOP_TEST_CACHE=1 时启用，内容/策略/试验次数不变则直接复用上次的输出
+TEST_CACHE_DIR = Path.home() / ".cache" / "vop_tests"
+
+def result_cache_dir(verilog_file: str, strategy: str, trials: int) -> Optional[Path]:
+    """返回该次运行的缓存目录；未启用缓存时返回None（CI可据此强制重跑）"""
+    if os.environ.get("VOP_TEST_CACHE") != "1":
+        return None
+    key = hashlib.sha256(Path(verilog_file).read_bytes() + strategy.encode() + str(trials).encode())
+    return TEST_CACHE_DIR / key.hexdigest()